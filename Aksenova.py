@@ -22,9 +22,20 @@
 
 # In[ ]:
 
-import re
-import codecs
-from random import choice, randint
+from bisect import bisect
+from collections import namedtuple
+from inspect import signature
+from itertools import accumulate, chain, islice, product
+from math import sqrt
+from random import Random, choice, randint
+from statistics import NormalDist
+from time import monotonic
+from Lambert import StreamStats, read_lines
+
+try:
+    import numpy as np
+except ImportError: # only the batch and finite-state evaluators use NumPy, and they check one string at a time without it
+    np = None
 
 
 # ## Step 2: defining general harmonic evaluator
@@ -178,6 +189,97 @@ class Harmony(object):
                 return string
             
             
+    def generate_words_bulk(self, n = 3, length = 10, seed = None):
+        """
+        Generates n strings of a given length, like generate_words, but
+        reproducibly and without ever restarting a string.
+        
+        Every random choice of _generate is weighted by the probability that
+        the string it leads to can still reach the given length exactly, so
+        the strings follow the distribution of the runs of _generate that
+        reach the length, and none is ever thrown away for overshooting it.
+        (_generate itself, when it restarts a string, keeps the specification
+        that a blocker may have rewritten, which favours blocked strings.)
+        
+        Arguments:
+            n (int): how many strings need to be generated;
+            length (int): length of the strings;
+            seed (int or Random): the seed of the random choices, or the
+                random number generator to draw them from.
+            
+        Returns:
+            list[str]: n generated strings.
+        """
+        if not self._verify_classes():
+            raise ValueError("Cannot generate dataset: the sets are overlapping.")
+        if length < 1:
+            raise ValueError("Words cannot be so short.")
+        rng = _rng(seed)
+        unpacked = self._unpack_classes()
+        blockers = sorted(self.blockers) if self.blockers is not None else []
+        
+        # A state of _generate is the step it is about to take ("blocker" or "cluster"),
+        # the number of symbols still missing, the specification, and the last symbol
+        # if it is an undergoer (whose class the next cluster must differ from).
+        # moves lists the steps from a state: their probabilities, the states they lead
+        # to (True for a complete string, False for one that overshoots), and the symbols
+        # they add.
+        def moves(state):
+            step, remaining, specs, last = state
+            if step == "blocker":
+                if not blockers:
+                    return [(1.0, ("cluster", remaining, specs, last), "")]
+                p = 1 / self.blocker_prob
+                result = []
+                for b in blockers:
+                    # rewrite the specification because of the blocker
+                    respecified = specs
+                    if self.blockers[b] not in specs:
+                        for spec in specs:
+                            if unpacked[spec] == unpacked[self.blockers[b]]:
+                                respecified = tuple(i for i in specs if i != spec) + (self.blockers[b],)
+                                break
+                    result.append((p / len(blockers), True if remaining == 1 else ("blocker", remaining - 1, respecified, None), b))
+                result.append((1 - p, ("cluster", remaining, specs, last), ""))
+                return result
+            collection = [i for i in specs if i != last]
+            result = []
+            for newchar in collection:
+                freq_b, freq_e = self.cl_lengths[unpacked[newchar]]
+                for freq in range(freq_b, freq_e + 1):
+                    following = True if freq == remaining else False if freq > remaining else ("blocker", remaining - freq, specs, newchar)
+                    result.append((1 / len(collection) / (freq_e - freq_b + 1), following, newchar * freq))
+            return result
+        
+        reaches = dict() # a state to the probability that _generate reaches the length from it
+        def reach(state):
+            if state is True or state is False:
+                return float(state)
+            if state not in reaches:
+                reaches[state] = sum(p * reach(following) for p, following, _ in moves(state))
+            return reaches[state]
+        
+        steps = dict() # a state to the steps from it that can still reach the length, and their cumulative weights
+        def draw(choices, weights):
+            return choices[bisect(weights, rng.random() * weights[-1])]
+        
+        starts = [("blocker", length, specs, None) for specs in product(*self.cl_members)]
+        start_weights = list(accumulate(reach(start) for start in starts))
+        if not start_weights[-1]:
+            raise ValueError(f"Cannot generate dataset: no string can be {length} symbols long.")
+        generated = []
+        for i in range(n):
+            state, pieces = draw(starts, start_weights), []
+            while state is not True:
+                if state not in steps:
+                    possible = [(following, symbols, p * reach(following)) for p, following, symbols in moves(state) if p * reach(following)]
+                    steps[state] = ([(following, symbols) for following, symbols, _ in possible], list(accumulate(weight for _, _, weight in possible)))
+                state, symbols = draw(*steps[state])
+                pieces.append(symbols)
+            generated.append("".join(pieces))
+        return generated
+    
+    
     def _mask(self, string, transparent):
         """
         Masks all non-initial mentions of the specified allophone: helper function.
@@ -834,6 +936,232 @@ def generate_sp_empty_word(alphabet, length = 5):
 def generate_sp_empty(alphabet, n = 10, length = 5):
     return [generate_sp_empty_word(alphabet, length) for i in range(n)]
 
+# ### Batch evaluators
+# 
+# The evaluators above check one string at a time, and most of the predicates scan the string once per vowel. The batch evaluators below give the same ratios, but run the finite-state version of each check (see below: `finite_state_rules` and `target_evaluator`) over the whole list of words at once, which `encode_words` turns into a padded array of code points for NumPy.
+# `batch_evaluators` maps each evaluator to its batch version; a check with no finite-state version, or any check without NumPy, is left to the per-string evaluator.
+
+# In[ ]:
+
+
+def encode_words(data):
+    """
+    Encodes a list of words as an array of their code points,
+    one row per word, padded with zeros, and an array of their lengths.
+    """
+    words = list(data)
+    lengths = np.fromiter(map(len, words), dtype = np.int64, count = len(words))
+    codes = np.zeros((len(words), lengths.max(initial = 0)), dtype = np.uint32)
+    codes[np.arange(codes.shape[1]) < lengths[:, None]] = np.frombuffer("".join(words).encode("utf-32-le"), dtype = np.uint32)
+    return codes, lengths
+
+def _ratio(correct):
+    """ The share of the words marked as correct, as the per-string evaluators report it. """
+    return int(correct.sum()) / len(correct)
+
+def _batch_ratio(evaluator, data, *evaluator_args, **evaluator_kwargs):
+    """ The ratio evaluator reports for data, computed with its finite-state version if it has one. """
+    try:
+        target = target_evaluator(evaluator, *evaluator_args, **evaluator_kwargs)
+    except ValueError:
+        return evaluator(data, *evaluator_args, **evaluator_kwargs)
+    return target.ratio(data)
+
+def harmonic_evaluator_batch(data, rule):
+    """ The same as harmonic_evaluator, evaluating all of the data at once. """
+    return _batch_ratio(harmonic_evaluator, data, rule)
+
+def evaluate_wfd_words_batch(data, voiced = ("b")):
+    """ The same as evaluate_wfd_words, evaluating all of the data at once. """
+    return _batch_ratio(evaluate_wfd_words, data, voiced)
+
+def evaluate_utp_strings_batch(data):
+    """ The same as evaluate_utp_strings, evaluating all of the data at once. """
+    return _batch_ratio(evaluate_utp_strings, data)
+
+def evaluate_first_last_words_batch(data):
+    """ The same as evaluate_first_last_words, evaluating all of the data at once. """
+    return _batch_ratio(evaluate_first_last_words, data)
+
+batch_evaluators = {
+    harmonic_evaluator: harmonic_evaluator_batch,
+    evaluate_wfd_words: evaluate_wfd_words_batch,
+    evaluate_utp_strings: evaluate_utp_strings_batch,
+    evaluate_first_last_words: evaluate_first_last_words_batch,
+}
+
+# ### Finite-state evaluators
+# 
+# Each predicate above can also be run as a deterministic finite-state machine. A `FiniteStateEvaluator` takes the predicate as a step function over a small state (which vowel classes were seen, whether a blocker was passed, and so on), numbers the states as they are reached, and keeps every transition in a table once it was computed; evaluating a string is then one pass of table lookups, and a string is rejected as soon as it reaches the dead state `None`. `finite_state_rules` maps each harmony predicate to its evaluator, and `SSRule` (below) compiles its rules the same way.
+
+# In[ ]:
+
+
+class FiniteStateEvaluator(object):
+    """
+    A string predicate compiled into a transition table.
+    
+    Arguments:
+    * step (function): takes a state and a symbol, and returns the next state,
+                       or None if no continuation of the string can be accepted;
+    * start: the state before the first symbol;
+    * accepting (function): tells if a string ending in a given state is accepted.
+    """
+    def __init__(self, step, start, accepting):
+        self.step = step
+        self.accepting = accepting
+        self.states, self.ids = [], {}
+        self.table, self.final = [], []
+        self.start = self._state_id(start)
+        
+    def _state_id(self, state):
+        if state is None:
+            return None
+        if state not in self.ids:
+            self.ids[state] = len(self.states)
+            self.states.append(state)
+            self.table.append({})
+            self.final.append(bool(self.accepting(state)))
+        return self.ids[state]
+    
+    def __call__(self, string):
+        table, q = self.table, self.start
+        for symbol in string:
+            row = table[q]
+            if symbol in row:
+                q = row[symbol]
+            else:
+                q = row[symbol] = self._state_id(self.step(self.states[q], symbol))
+            if q is None:
+                return False
+        return self.final[q]
+    
+    def transition(self, q, symbol):
+        """ The id of the state after reading symbol in the state with id q (None for the dead state). """
+        row = self.table[q]
+        if symbol not in row:
+            row[symbol] = self._state_id(self.step(self.states[q], symbol))
+        return row[symbol]
+    
+    def complete(self, alphabet):
+        """ Computes every transition over the alphabet between the states reachable from the start. """
+        queue, reached = [self.start], {self.start}
+        for q in queue:
+            row = self.table[q]
+            for symbol in alphabet:
+                self.transition(q, symbol)
+                if row[symbol] is not None and row[symbol] not in reached:
+                    reached.add(row[symbol])
+                    queue.append(row[symbol])
+    
+    def evaluate_encoded(self, codes, lengths):
+        """
+        Tells, for every word encoded by encode_words, if it is accepted,
+        running the whole array through the table one column at a time
+        (the states reachable over the symbols of the words must be finite).
+        """
+        alphabet = np.zeros(int(codes.max(initial = 0)) + 1, dtype = bool)
+        alphabet[codes.ravel()] = True
+        alphabet[0] = np.count_nonzero(codes == 0) > codes.size - lengths.sum() # 0 pads the words, but it may be a symbol too
+        present = np.flatnonzero(alphabet)
+        symbols = [chr(c) for c in present]
+        self.complete(symbols)
+        padding, dead = len(symbols), len(self.states)
+        table = np.full((dead + 1, len(symbols) + 1), dead, dtype = np.intp)
+        for q, row in enumerate(self.table):
+            for j, symbol in enumerate(symbols):
+                if row.get(symbol) is not None:
+                    table[q, j] = row[symbol]
+        table[:, padding] = np.arange(dead + 1) # the padding after a word keeps its state
+        table = table.ravel()
+        lookup = np.full(len(alphabet), padding, dtype = np.intp)
+        lookup[present] = np.arange(len(symbols))
+        q = np.full(len(codes), self.start, dtype = np.intp)
+        for j in range(codes.shape[1]):
+            column = lookup.take(codes[:, j])
+            if alphabet[0]:
+                column[j >= lengths] = padding
+            q = table.take(q * (padding + 1) + column)
+        return np.array(self.final + [False]).take(q)
+    
+    def evaluate(self, data):
+        """ Tells, for every string of data, if it is accepted. """
+        if np is None:
+            return [self(w) for w in data]
+        return self.evaluate_encoded(*encode_words(data)).tolist()
+    
+    def ratio(self, data):
+        """ The share of data that is accepted, as harmonic_evaluator reports it. """
+        if np is None:
+            return sum(map(self, data)) / len(data)
+        return _ratio(self.evaluate_encoded(*encode_words(data)))
+
+def intersect(*evaluators):
+    """ An evaluator accepting the strings that all of the evaluators accept. """
+    def step(states, symbol):
+        states = tuple(e.step(q, symbol) for e, q in zip(evaluators, states))
+        return None if None in states else states
+    return FiniteStateEvaluator(step, tuple(e.states[e.start] for e in evaluators),
+                                lambda states : all(e.accepting(q) for e, q in zip(evaluators, states)))
+
+def _presence_evaluator(classes, accepting):
+    """
+    An evaluator whose state is the set of classes (strings of symbols) seen so far,
+    for predicates that, once they fail, fail for any longer string.
+    """
+    def step(seen, symbol):
+        seen = seen | {i for i, c in enumerate(classes) if symbol in c}
+        return seen if accepting(seen) else None
+    return FiniteStateEvaluator(step, frozenset(), accepting)
+
+def _rounding_step(state, symbol):
+    # the state is whether a vowel was seen and whether the harmony is rounded, as in rounding_harmony
+    high, low, rounded = "iIuU", "aeoO", "uUoO"
+    seen, ro = state
+    if symbol not in high + low:
+        return state
+    if not seen:
+        return (True, symbol in rounded)
+    if symbol in low:
+        return None if symbol in rounded else (True, False)
+    return None if ro != (symbol in rounded) else state
+
+def _single_blockers_step(state, symbol):
+    # the state is whether the first "f" was passed, and which of "a" and "o" were seen before it
+    blocked, a, o = state
+    if blocked:
+        return None if symbol == "o" else state
+    if symbol == "f":
+        return (True, a, o)
+    a, o = a or symbol == "a", o or symbol == "o"
+    return None if a and o else (False, a, o)
+
+def _double_blockers_step(state, symbol):
+    # the state is which of "a" and "o" were seen, whether the first "t" was passed,
+    # and which of "b" and "p" were seen before it
+    blocked, a, o, b, p = state
+    a, o = a or symbol == "a", o or symbol == "o"
+    if a and o:
+        return None
+    if blocked:
+        return None if symbol == "b" else (True, a, o, False, False)
+    if symbol == "t":
+        return (True, a, o, False, False)
+    b, p = b or symbol == "b", p or symbol == "p"
+    return None if b and p else (False, a, o, b, p)
+
+finite_state_rules = {
+    backness_harmony: _presence_evaluator(("Iaou", "ieOU"), lambda seen : len(seen) < 2),
+    rounding_harmony: FiniteStateEvaluator(_rounding_step, (False, False), lambda state : True),
+    front_harmony: _presence_evaluator(("AOy", "aou"), lambda seen : len(seen) < 2),
+    single_harmony_no_blockers: _presence_evaluator(("a", "o"), lambda seen : len(seen) < 2),
+    single_harmony_with_blockers: FiniteStateEvaluator(_single_blockers_step, (False, False, False), lambda state : True),
+    double_harmony: _presence_evaluator(("a", "o", "u", "e"), lambda seen : len(seen) < 2),
+    double_harmony_no_blockers: _presence_evaluator(("a", "o", "b", "p"), lambda seen : not ({0, 1} <= seen or {2, 3} <= seen)),
+    double_harmony_with_blockers: FiniteStateEvaluator(_double_blockers_step, (False,) * 5, lambda state : True),
+}
+finite_state_rules[backness_and_rounding] = intersect(finite_state_rules[backness_harmony], finite_state_rules[rounding_harmony])
+
 # # Preparing training samples for the experiments
 # 
 # ### Experiment 1: Word-final devoicing
@@ -854,10 +1182,9 @@ print(toy_wfd[:15])
 
 
 german_data = []
-with codecs.open('natural_data/german.txt', encoding='utf-8') as f:
-    for line in f:
-        if line != "":
-            german_data.append(line[:-1])
+for line in read_lines('natural_data/german.txt', keepends=True):
+    if line != "":
+        german_data.append(line[:-1])
             
 print(len(german_data))
 print(german_data[:10], "...")
@@ -962,14 +1289,8 @@ print(toy_vhnb[:15], "...")
 # In[ ]:
 
 
-finnish_data = []
-with codecs.open('natural_data/finnish.txt', encoding='utf-8') as f:
-    for line in f:
-        if line != "":
-            finnish_data.append(line[:-2])
-            
-print(len(finnish_data))
-print(finnish_data[:10], "...")
+# The raw corpus is streamed straight into the filter below, so only the cleaned words are ever held in memory.
+finnish_data = (line[:-2] for line in read_lines('natural_data/finnish.txt', keepends=True) if line != "")
 
 # Then the unharmonic stems are filtered to clean the data. Apart from the digits and punctuations, words are also filtered that contain `}` that stands here in this dataset for Swedish `å`, and therefore is ill-defined in terms of the harmony. Then I rewrite `{` as `ä` and `|` as `ö` in order to normalize the spelling with respect to Turkish examples further. Finally, non-harmonic stems are filtered.
 
@@ -1083,24 +1404,22 @@ banned = []
 non_harmonic = []
 turkish_harmony = []
 
-with codecs.open('natural_data/turkish.txt', encoding='utf-8') as f:
+ban = ["!", "-", "w", "x", "A"]
+for line in read_lines('natural_data/turkish.txt', keepends=True):
+    if line == "":
+        continue
+    w = line[:-2]
     
-    ban = ["!", "-", "w", "x", "A"]
-    for line in f:
-        if line == "":
-            continue
-        w = line[:-2]
+    if any([(i in w) for i in ban]):
+        banned.append(w)
+        continue
+        
+    if backness_harmony(w) and rounding_harmony(w):
+        w = w.replace("K", "k")
+        turkish_harmony.append(w)
+    else:
+        non_harmonic.append(w)
         
-        if any([(i in w) for i in ban]):
-            banned.append(w)
-            continue
-            
-        if backness_harmony(w) and rounding_harmony(w):
-            w = w.replace("K", "k")
-            turkish_harmony.append(w)
-        else:
-            non_harmonic.append(w)
-            
 print(len(banned))
 print(banned[:30], "...\n")
 
@@ -1199,31 +1518,80 @@ class SSRule(object):
         self.right_context = right_context
         self.can_follow = can_follow
 
+    def _key(self):
+        return (tuple(self.symbols), self.target, self.right_context, tuple(self.can_follow))
+
     def is_grammatical(self, string):
         """ Checks if the given form follows a rule that is encoded.
         
         * string (str): a string well-formedness of which needs to be checked.
         """
+        return self.evaluator()(string)
+    
+    def evaluator(self):
+        """ Compiles is_grammatical into a FiniteStateEvaluator (once per rule).
         
-        # get rid of all irrelevant symbols (not symbols and contexts)
-        string = "".join([i for i in string if i in list(self.symbols) + [self.right_context]])
+        Only the symbols and the right context are read; a target enters the
+        tier if the next of those is the right context, any other symbol does
+        so directly, and a target on the tier can only be followed by a symbol
+        of can_follow. The state is whether the last symbol read was a target
+        and whether the tier ends in the target.
+        """
+        key = ("tier",) + self._key()
+        if key not in _compiled_rules:
+            relevant = list(self.symbols) + [self.right_context]
+            
+            def project(last, symbol):
+                if last and symbol not in self.can_follow:
+                    return None
+                return symbol == self.target
+            
+            def step(state, symbol):
+                if symbol not in relevant:
+                    return state
+                pending, last = state
+                if pending and symbol == self.right_context:
+                    last = project(last, self.target)
+                    if last is None:
+                        return None
+                pending = False
+                if symbol in self.symbols:
+                    if symbol == self.target:
+                        pending = True
+                    else:
+                        last = project(last, symbol)
+                        if last is None:
+                            return None
+                return (pending, last)
+            
+            _compiled_rules[key] = FiniteStateEvaluator(step, (False, False), lambda state : True)
+        return _compiled_rules[key]
+    
+    def trigger_evaluator(self):
+        """ Compiles the check of evaluate_mitsl_word into a FiniteStateEvaluator (once per rule).
         
-        # construct a tier of that strings
-        tier = ""
-        for i in range(len(string)):
-            if string[i] in self.symbols:
-                if string[i] == self.target and i < len(string) - 1 and\
-                    string[i + 1] == self.right_context:
-                    tier += self.target
-                elif string[i] != self.target:
-                    tier += string[i]
-
-        # check if that tier is well-formed
-        for t in range(len(tier)):
-            if tier[t] == self.target and t < len(tier) - 1 and\
-                tier[t + 1] not in self.can_follow:
-                return False
-        return True
+        A string is rejected if it contains target + right_context, and a symbol
+        outside of can_follow comes after the last (non-overlapping) occurrence
+        of it. The state is whether an occurrence was seen, the part of the next
+        occurrence read so far, and whether such a symbol was read since.
+        """
+        key = ("trigger",) + self._key()
+        if key not in _compiled_rules:
+            trigger, tier = self.target + self.right_context, "".join(self.symbols)
+            
+            def step(state, symbol):
+                triggered, partial, violated = state
+                partial += symbol
+                if partial == trigger:
+                    return (True, "", False)
+                while not trigger.startswith(partial):
+                    partial = partial[1:]
+                return (triggered, partial, violated or (symbol in tier and symbol not in self.can_follow))
+            
+            _compiled_rules[key] = FiniteStateEvaluator(step, (False, "", False), lambda state : not (state[0] and state[2]))
+        return _compiled_rules[key]
+
+_compiled_rules = dict()
 
 # #### 2. Writing a generator of a sequence grammatical wrt the rule
 
@@ -1398,12 +1766,161 @@ def mitsl_harmony_generate(n = 10, length = 10, grammatical = True,
         
     return strings
 
+# ### Bulk generators
+# 
+# The generators above draw from the global random number generator, one symbol at a time, building strings by repeated concatenation. The bulk versions below take a `seed` (or a `random.Random` to draw from, so that several generators can share one), and build the same kinds of strings with the same distributions, drawing all the symbols of a batch of words at once where the words are uniformly random and joining every string only once; `Harmony.generate_words_bulk` is the bulk version of `Harmony.generate_words`.
+
+# In[ ]:
+
+
+def _rng(seed):
+    """ The random number generator for seed: seed itself if it is one, or else a new one seeded with it. """
+    return seed if isinstance(seed, Random) else Random(seed)
+
+def _uniform_words(rng, symbols, n, length):
+    """ n words of the given length whose symbols (characters) are drawn uniformly, all in a single draw. """
+    drawn = "".join(rng.choices(symbols, k = n * length))
+    return [drawn[i:i + length] for i in range(0, n * length, length)] if length else [""] * n
+
+def generate_turkish_words_bulk(n = 10, length = 10, cons = "x", vowel_cluster = (1, 2),
+                                cons_cluster = (1, 3), seed = None):
+    """ The same as generate_turkish_words, drawing from the given seed. """
+    if length < 1:
+        raise ValueError("Words cannot be so short.")
+    rng = _rng(seed)
+    vowels = {
+        (True, True, True):"u",
+        (True, True, False):"I",
+        (True, False, True):"o",
+        (True, False, False):"a",
+        (False, True, True):"U",
+        (False, True, False):"i",
+        (False, False, True):"O",
+        (False, False, False):"e"
+    }
+    words = []
+    for i in range(n):
+        backness, height, rounding = rng.choice([True, False]), rng.choice([True, False]), rng.choice([True, False])
+        pieces, size = [], 0
+        if rng.choice([0, 1]):
+            pieces.append(cons * rng.randint(*cons_cluster))
+            size += len(pieces[-1])
+        while size < length:
+            vc = rng.randint(*vowel_cluster)
+            # this part is needed to avoid the word-initial *oo clusters
+            if vc > 1 and not height and rounding:
+                pieces.append(vowels[(backness, height, rounding)] + vowels[(backness, height, False)] * (vc - 1))
+                rounding = False
+            else:
+                pieces.append(vowels[(backness, height, rounding)] * vc)
+            pieces.append(cons * rng.randint(*cons_cluster))
+            size += len(pieces[-2]) + len(pieces[-1])
+            height = rng.choice([True, False])
+            rounding = False if not height else rounding
+        words.append("".join(pieces)[:length])
+    return words
+
+def generate_wfd_bulk(n = 10, sigma = ("a", "b", "p"), devoice = (("b"), ("p")),
+                      length = 10, pairs = False, seed = None):
+    """ The same as generate_wfd, drawing from the given seed. """
+    if length < 1:
+        raise ValueError("The string has a very weird length.")
+    before, after = devoice
+    devoiced = {b: after[before.index(b)] for b in before}
+    strings = _uniform_words(_rng(seed), sigma, n, length)
+    surface = [w[:-1] + devoiced[w[-1]] if w[-1] in devoiced else w for w in strings]
+    return list(zip(strings, surface)) if pairs else surface
+
+def generate_utp_strings_bulk(n = 10, length = 5, seed = None):
+    """ The same as generate_utp_strings, drawing from the given seed. """
+    strings = []
+    for w in _uniform_words(_rng(seed), "HL", n, length):
+        # as utp_tones, every L between the first and the last H becomes H
+        first_h, last_h = w.find("H"), w.rfind("H")
+        strings.append(w if first_h < 0 else w[:first_h] + "H" * (last_h - first_h + 1) + w[last_h + 1:])
+    return strings
+
+def first_last_words_bulk(n = 10, length = 10, seed = None):
+    """ The same as first_last_words, drawing from the given seed. """
+    if length < 2:
+        raise ValueError("First-last words have at least two symbols.")
+    rng = _rng(seed)
+    # the last symbol of a UR is always overwritten by the first, so it is not drawn
+    return [first + middle + first for first, middle in zip(rng.choices("ao", k = n), _uniform_words(rng, "aox", n, length - 2))]
+
+def generate_sp_empty_bulk(alphabet, n = 10, length = 5, seed = None):
+    """ The same as generate_sp_empty, drawing from the given seed. """
+    return _uniform_words(_rng(seed), alphabet, n, length)
+
+def _rule_sequence(rule, length, grammatical, rng):
+    """ The same as generate_rule_sequence, drawing from rng. """
+    anywhere = list(rule.symbols) + [rule.right_context]
+    after_context = list(rule.can_follow) + [rule.right_context]
+    sequence, state = [], 0
+    for i in range(length):
+        sequence.append(rng.choice(after_context if state == 2 else anywhere))
+        if state == 0 and sequence[-1] == rule.target:
+            state = 1
+        elif state == 1 and sequence[-1] == rule.right_context:
+            state = 2
+        elif state == 1 and sequence[-1] != rule.target:
+            state = 0
+    if not grammatical:
+        violate = rule.target + rule.right_context +\
+            rng.choice([i for i in list(rule.symbols) if i not in rule.can_follow])
+        index_violate = rng.randrange(length - 3)
+        sequence[index_violate:index_violate + 3] = violate
+    return "".join(sequence)
+
+def _intertwine(str1, str2, rng, r = (0, 3)):
+    """ The same as intertwine, drawing from rng. """
+    pieces, i1, i2 = [], 0, 0
+    current = rng.choice([1, 2])
+    while i1 < len(str1) or i2 < len(str2):
+        cut = rng.randrange(r[0], r[1])
+        if current == 1:
+            pieces.append(str1[i1:i1 + cut])
+            i1, current = i1 + cut, 2
+        else:
+            pieces.append(str2[i2:i2 + cut])
+            i2, current = i2 + cut, 1
+    return "".join(pieces)
+
+def itsl_harmony_generate_bulk(n = 10, length = 10, grammatical = True,
+                               rule_1 = None, seed = None):
+    """ The same as itsl_harmony_generate, drawing from the given seed. """
+    if rule_1 == None:
+        rule_1 = SSRule(symbols = ("o", "e", "a"), target = "o",\
+                        right_context = "x", can_follow = ("a", "o"))
+    rng = _rng(seed)
+    return [_rule_sequence(rule_1, length, grammatical, rng) for i in range(n)]
+
+def mitsl_harmony_generate_bulk(n = 10, length = 10, grammatical = True,
+                                rule_1 = None, rule_2 = None, seed = None):
+    """ The same as mitsl_harmony_generate, drawing from the given seed. """
+    if rule_1 == None:
+        rule_1 = SSRule(symbols = ("o", "e", "a"), target = "o",\
+                        right_context = "x", can_follow = ("a", "o"))
+    if rule_2 == None:
+        rule_2 = SSRule(symbols = ("b", "p", "d"), target = "b",\
+                        right_context = "y", can_follow = ("b", "p"))
+    rng = _rng(seed)
+    len_part_1 = length // 2
+    len_part_2 = length - len_part_1
+    strings = []
+    for i in range(n):
+        mistake = None if grammatical else rng.choice(["R1", "R2", "both"])
+        part_1 = _rule_sequence(rule_1, len_part_1, mistake not in ("R1", "both"), rng)
+        part_2 = _rule_sequence(rule_2, len_part_2, mistake not in ("R2", "both"), rng)
+        strings.append(_intertwine(part_1, part_2, rng))
+    return strings
+
 # ### Tools: collecting data generators for the experiments
 
 # In[ ]:
 
 
-def generate_harmony(kind="first-last", length=range(2, 7), number=1000):
+def generate_harmony(kind="first-last", length=range(2, 7), number=1000, seed=None):
     """
     Generates a harmony based on 3 parameters.
     
@@ -1412,6 +1929,8 @@ def generate_harmony(kind="first-last", length=range(2, 7), number=1000):
         "first-last", "double", "assimilation-one", "assimilation-two"
     * length (range): a range of lengths of the intended strings
     * number (int): a number of strings to be generated
+    * seed (int): if given, the strings are generated by the bulk
+                  generators, drawing from this seed
     
     Outputs:
     * list: a collection of strings.
@@ -1419,8 +1938,13 @@ def generate_harmony(kind="first-last", length=range(2, 7), number=1000):
     
     # preparing data for easy generation
     lennum = {r:number // len(length) for r in length}
-    hmap = {"assimilation-two" : mitsl_harmony_generate,
-            "assimilation-one" : itsl_harmony_generate}
+    if seed is None:
+        hmap = {"assimilation-two" : mitsl_harmony_generate,
+                "assimilation-one" : itsl_harmony_generate}
+    else:
+        rng = _rng(seed)
+        hmap = {"assimilation-two" : lambda n, l : mitsl_harmony_generate_bulk(n, l, seed = rng),
+                "assimilation-one" : lambda n, l : itsl_harmony_generate_bulk(n, l, seed = rng)}
     
     # generating the data
     data = [i for l in lennum for i in hmap[kind](lennum[l], l)]
@@ -1434,54 +1958,334 @@ def generate_harmony(kind="first-last", length=range(2, 7), number=1000):
 # In[ ]:
 
 
+def mitsl_evaluator(rules):
+    """ The evaluator of evaluate_mitsl_word for the given rules, compiled once. """
+    key = ("mitsl",) + tuple(rule._key() for rule in rules)
+    if key not in _compiled_rules:
+        _compiled_rules[key] = intersect(*[rule.trigger_evaluator() for rule in rules])
+    return _compiled_rules[key]
+
 def evaluate_mitsl_word(rules: list, string: str):
-    for rule in rules:
-        if rule.target + rule.right_context not in string:
-            continue
-        '''chars = set()
-        chars.update(rule.symbols)
-        chars.update(rule.target)
-        chars.update(rule.right_context)
-        chars.update(rule.can_follow)
-        tier = re.sub(f'[^{"".join(chars)}]', '', string)#replace all irrelevant characters'''
-        tier = re.sub(f'[^{"".join(rule.symbols)}]', '', re.sub(f'.*?{rule.target + rule.right_context}', '', string))
-        if any(s not in rule.can_follow for s in tier):
-            return False
-    return True
+    return mitsl_evaluator(rules)(string)
+
+# the rules that evaluate_mitsl_words checks, of which evaluate_itsl_words checks the first
+assimilation_rules = [
+    SSRule(symbols = ("o", "e", "a"), target = "o",\
+           right_context = "x", can_follow = ("a", "o")),
+    SSRule(symbols = ("b", "p", "d"), target = "b",\
+           right_context = "y", can_follow = ("b", "p")),
+]
 
 def evaluate_mitsl_words(strings):
-    rule_1 = SSRule(symbols = ("o", "e", "a"), target = "o",\
-                        right_context = "x", can_follow = ("a", "o"))
-    rule_2 = SSRule(symbols = ("b", "p", "d"), target = "b",\
-                        right_context = "y", can_follow = ("b", "p"))
-    
-    correct = 0
-    incorrect = set()
-    for string in strings:
-        if evaluate_mitsl_word([rule_1, rule_2], string):
-            correct += 1
+    return mitsl_evaluator(assimilation_rules).ratio(strings)
+
+def evaluate_itsl_words(strings):
+    return mitsl_evaluator(assimilation_rules[:1]).ratio(strings)
+
+# ### Exact evaluation
+# 
+# The learned grammars and the target patterns are all regular, so consistency and completeness need not be estimated from samples: they can be counted. `target_evaluator` gives the `FiniteStateEvaluator` of the strings that an evaluator of the experiments counts as correct, and `exact_overlap` reads the product of that evaluator and the `Acceptor` of a learned grammar (see Lambert.py) one length at a time, counting how many words of every length the grammar accepts, how many the target accepts, and how many both accept.
+# `exact_consistency` (the share of the grammar's words that are in the target) and `exact_completeness` (the share of the target's words that the grammar accepts) are then computed from the counts of a single length, or of all lengths up to a bound.
+
+# In[ ]:
+
+
+def _wfd_step(state, symbol, voiced):
+    # the state is whether the last symbol read is voiced
+    return symbol in voiced
+
+def _utp_step(state, symbol):
+    # the state is whether an H was read, and whether an L was read since the last H
+    if symbol not in ("H", "L"):
+        raise ValueError("Unexpected symbols in the tonal string!")
+    h, l = state
+    if symbol == "H":
+        return None if l else (True, False)
+    return (h, h)
+
+def _first_last_step(state, symbol):
+    # the state is the first and the last symbol read, or () for the empty string
+    return (state[0] if state else symbol, symbol)
+
+def target_evaluator(evaluator, *evaluator_args, **evaluator_kwargs):
+    """
+    Compiles the check made by an evaluator of the experiments (per string or
+    batch, called with the given arguments after the data) into a
+    FiniteStateEvaluator accepting exactly the strings it counts as correct.
+    """
+    evaluator = {batch: e for e, batch in batch_evaluators.items()}.get(evaluator, evaluator)
+    arguments = signature(evaluator).bind(None, *evaluator_args, **evaluator_kwargs)
+    arguments.apply_defaults()
+    arguments = arguments.arguments
+    if evaluator is harmonic_evaluator:
+        if arguments["rule"] not in finite_state_rules:
+            raise ValueError(f"{arguments['rule'].__name__} has no finite-state version.")
+        return finite_state_rules[arguments["rule"]]
+    if evaluator is evaluate_itsl_words:
+        return mitsl_evaluator(assimilation_rules[:1])
+    if evaluator is evaluate_mitsl_words:
+        return mitsl_evaluator(assimilation_rules)
+    key = (evaluator.__name__,) + tuple(arguments.get("voiced", ()))
+    if key not in _compiled_rules:
+        if evaluator is evaluate_wfd_words:
+            voiced = tuple(arguments["voiced"])
+            _compiled_rules[key] = FiniteStateEvaluator(lambda state, symbol : _wfd_step(state, symbol, voiced), False, lambda state : not state)
+        elif evaluator is evaluate_utp_strings:
+            _compiled_rules[key] = FiniteStateEvaluator(_utp_step, (False, False), lambda state : True)
+        elif evaluator is evaluate_first_last_words:
+            _compiled_rules[key] = FiniteStateEvaluator(_first_last_step, (), lambda state : not state or state[0] == state[1])
         else:
-            incorrect.add(string)
+            raise ValueError(f"{evaluator.__name__} has no finite-state version.")
+    return _compiled_rules[key]
 
-    #print(f"Percentage of harmonic words: {int((correct / len(strings)) * 100)}%.")
-    #print(incorrect)
-    return correct / len(strings)
+# The counts of the words of one length: those the grammar accepts, those the target accepts, and those both accept
+LanguageOverlap = namedtuple("LanguageOverlap", ("length", "grammar", "target", "both"))
 
-def evaluate_itsl_words(strings):
-    rule_1 = SSRule(symbols = ("o", "e", "a"), target = "o",\
-                        right_context = "x", can_follow = ("a", "o"))
+def exact_overlap(grammar, target, max_length, alphabet = None):
+    """
+    Counts the words of every length up to max_length that a learned grammar
+    and a target language accept.
+    The time taken grows with the number of states of the grammar's acceptor
+    that words of each length reach, which for an ITSL grammar of
+    natural-language data multiplies with every letter, so keep max_length
+    small (around 8) for those.
     
-    correct = 0
-    incorrect = set()
-    for string in strings:
-        if evaluate_mitsl_word([rule_1], string):
-            correct += 1
-        else:
-            incorrect.add(string)
+    Arguments:
+    * grammar (TSL_Learner): a learned grammar;
+    * target (FiniteStateEvaluator): the target language, see target_evaluator;
+    * max_length (int): the length of the longest words counted;
+    * alphabet (iterable[char]): the symbols of the words, by default those
+                                 of the grammar.
+                                 
+    Returns:
+    * list[LanguageOverlap]: the counts of every length from 0 to max_length.
+    """
+    acceptor = grammar.acceptor()
+    alphabet = sorted(acceptor.alphabet if alphabet is None else set(alphabet))
+    target.complete(alphabet)
+    # the number of words of the current length leading to each pair of states of the grammar and the target (None for either's dead state)
+    pairs = {(acceptor.start, target.start): 1}
+    overlap = []
+    for length in range(max_length + 1):
+        counts = [0, 0, 0]
+        for (state, q), number in pairs.items():
+            in_grammar, in_target = acceptor.accepts(state), q is not None and target.final[q]
+            counts[0] += number if in_grammar else 0
+            counts[1] += number if in_target else 0
+            counts[2] += number if in_grammar and in_target else 0
+        overlap.append(LanguageOverlap(length, *counts))
+        following = dict()
+        for (state, q), number in pairs.items():
+            for symbol in alphabet:
+                pair = (None if state is None else acceptor.step(state, symbol), None if q is None else target.table[q][symbol])
+                if pair != (None, None):
+                    following[pair] = following.get(pair, 0) + number
+        pairs = following
+    return overlap
+
+def exclude_words(overlap, grammar, target, words, alphabet = None):
+    """
+    Removes some words (e.g. the training data) from the target language
+    whose counts exact_overlap returned (over the same alphabet).
+    """
+    alphabet = grammar.acceptor().alphabet if alphabet is None else set(alphabet)
+    overlap = [list(counts) for counts in overlap]
+    for w in set(words):
+        if len(w) < len(overlap) and set(w) <= alphabet and target(w):
+            overlap[len(w)][2] -= 1
+            overlap[len(w)][3] -= 1 if grammar.scan(w) else 0
+    return [LanguageOverlap(*counts) for counts in overlap]
+
+def exact_consistency(overlap):
+    """ The share of the words counted in overlap that the grammar accepts and that are in the target language (None if the grammar accepts none). """
+    accepted = sum(counts.grammar for counts in overlap)
+    return sum(counts.both for counts in overlap) / accepted if accepted else None
+
+def exact_completeness(overlap):
+    """ The share of the words counted in overlap that are in the target language and that the grammar accepts (None if the target has none). """
+    targets = sum(counts.target for counts in overlap)
+    return sum(counts.both for counts in overlap) / targets if targets else None
+
+# ### Generating target strings
+# 
+# `target_words` lists the strings of a target language, as `test-completeness-learn.py` needs them, by walking its `FiniteStateEvaluator` rather than evaluating every string over the alphabet: a prefix is only extended while some string of the current length that it begins is accepted, so only well-formed strings are ever built.
+
+# In[ ]:
 
-    #print(f"Percentage of harmonic words: {int((correct / len(strings)) * 100)}%.")
-    # # # # # print(incorrect)
-    return correct / len(strings)
+
+def target_words(target, alphabet, exclude = ()):
+    """
+    Generates the strings that a FiniteStateEvaluator accepts, shortest first
+    and those of each length in the order of product(alphabet, repeat = length).
+    
+    Arguments:
+    * target (FiniteStateEvaluator): the target language, see target_evaluator;
+    * alphabet (iterable[char]): the symbols of the strings, in order;
+    * exclude (set[str]): strings that are skipped, e.g. the training data.
+    
+    Outputs:
+    * generator[str]: the accepted strings; it only ends if there are finitely
+                      many of them over the alphabet.
+    """
+    alphabet = list(alphabet)
+    accepts, survives = dict(), dict() # (state id, length) to whether some string of that length read from that state is accepted, or at least not rejected yet
+    
+    def accepts_within(q, length):
+        if q is None:
+            return False
+        if (q, length) not in accepts:
+            accepts[q, length] = target.final[q] if length == 0 else any(accepts_within(target.transition(q, symbol), length - 1) for symbol in alphabet)
+        return accepts[q, length]
+    
+    def survives_within(q, length):
+        if q is None:
+            return False
+        if (q, length) not in survives:
+            survives[q, length] = length == 0 or any(survives_within(target.transition(q, symbol), length - 1) for symbol in alphabet)
+        return survives[q, length]
+    
+    def extensions(w, q, remaining):
+        if remaining == 0:
+            yield w
+            return
+        for symbol in alphabet:
+            following = target.transition(q, symbol)
+            if accepts_within(following, remaining - 1):
+                yield from extensions(w + symbol, following, remaining - 1)
+    
+    length = 0
+    while survives_within(target.start, length): # once every string of some length is rejected, so is every longer one
+        if accepts_within(target.start, length):
+            for w in extensions("", target.start, length):
+                if w not in exclude:
+                    yield w
+        length += 1
+
+# ### Evaluation engine
+# 
+# The evaluators of the experiments only report a ratio, so listing the strings that fail means evaluating them all again. Instead, `checker` turns any of them into a check that tells, for every string of a list, whether it is correct (through its finite-state version, if it has one), and `evaluate_stream` reads a stream of strings once, checking it in batches, and reports how many strings were accepted, which ones were rejected, and how fast they were evaluated. The same kind of check can be made of anything that accepts strings, e.g. a learned grammar: `lambda batch : [g.scan(w) for w in batch]`.
+
+# In[ ]:
+
+
+class EvaluationReport(namedtuple("EvaluationReport", ("accepted", "rejected", "stats"))):
+    """
+    The outcome of evaluate_stream: the number of strings accepted, the
+    (index, string) pairs of those rejected, and the StreamStats of the run
+    (see Lambert.py), whose words are the strings evaluated.
+    """
+    @property
+    def evaluated(self):
+        return self.stats.words
+    
+    @property
+    def ratio(self):
+        """ The share of the strings evaluated that were accepted, as the evaluators report it. """
+        return self.accepted / self.stats.words
+
+def checker(evaluator, *evaluator_args, **evaluator_kwargs):
+    """
+    The check made by an evaluator of the experiments (called with the given
+    arguments after the data), as a function that takes a list of strings
+    and returns a list telling for each of them if it is correct.
+    """
+    try:
+        return target_evaluator(evaluator, *evaluator_args, **evaluator_kwargs).evaluate
+    except ValueError: # without a finite-state version, the evaluator is called on every string on its own
+        return lambda batch : [evaluator([w], *evaluator_args, **evaluator_kwargs) == 1 for w in batch]
+
+def evaluate_stream(data, check, batch_size = 1000, until = None):
+    """
+    Evaluates a stream of strings in a single pass.
+    
+    Arguments:
+    * data (iterable[str]): the strings that need to be evaluated;
+    * check (function): takes a list of strings and tells for each of them
+                        if it is correct, see checker;
+    * batch_size (int): how many strings are checked at a time;
+    * until (function): if given, it is called with the numbers of strings
+                        accepted and evaluated so far after every batch, and
+                        evaluation stops once it returns True.
+                        
+    Returns:
+    * EvaluationReport: the strings accepted and rejected, and the throughput.
+    """
+    stats = StreamStats()
+    accepted, rejected = 0, []
+    words = iter(data)
+    batch = list(islice(words, batch_size))
+    while batch:
+        started = monotonic()
+        results = check(batch)
+        stats.busy_seconds += monotonic() - started
+        accepted += sum(map(bool, results))
+        rejected.extend((stats.words + i, w) for i, (w, correct) in enumerate(zip(batch, results)) if not correct)
+        stats.words += len(batch)
+        stats.batches += 1
+        if until is not None and until(accepted, stats.words):
+            break
+        batch = list(islice(words, batch_size))
+    return EvaluationReport(accepted, rejected, stats)
+
+# ### Sequential evaluation
+# 
+# Evaluating thousands of strings is wasted work when the ratio is plainly 100% or 0% after a few hundred of them. `sequential_evaluator` evaluates the strings in batches, in a random order, and after every batch computes the Wilson score interval of the ratio over all of the strings (`wilson_interval`), taking into account that the strings evaluated so far were drawn without replacement from a finite list. It stops as soon as the interval is narrower than a given tolerance, and if every string has been evaluated, the interval is the ratio itself.
+
+# In[ ]:
+
+
+# The ratio of the strings evaluated, the interval of the ratio over all of them, how many of them were evaluated, and the EvaluationReport of those
+SequentialEstimate = namedtuple("SequentialEstimate", ("ratio", "low", "high", "evaluated", "total", "report"))
+
+def wilson_interval(correct, evaluated, total = None, confidence = 0.95):
+    """
+    The Wilson score interval of the ratio of correct strings, given that
+    correct out of evaluated strings were correct. If total is given, the
+    evaluated strings were drawn without replacement from total strings,
+    and the interval is of the ratio over all of those.
+    """
+    if not evaluated:
+        return (0.0, 1.0)
+    ratio = correct / evaluated
+    n = evaluated
+    if total is not None:
+        if evaluated >= total:
+            return (ratio, ratio)
+        n = evaluated * (total - 1) / (total - evaluated) # the finite population correction, as an effective sample size
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    centre = (ratio + z * z / (2 * n)) / (1 + z * z / n)
+    half = z / (1 + z * z / n) * sqrt(ratio * (1 - ratio) / n + z * z / (4 * n * n))
+    return (max(0.0, centre - half), min(1.0, centre + half))
+
+def sequential_evaluator(data, check, tolerance = 0.02, confidence = 0.95, batch_size = 250, seed = 0):
+    """
+    Estimates the ratio of the strings of data that are correct, evaluating
+    them in batches until the interval of the ratio is narrower than tolerance.
+    
+    Arguments:
+    * data (list[str]): a list of strings that need to be evaluated;
+    * check (function): takes a list of strings and tells for each of them
+                        if it is correct, see checker;
+    * tolerance (float): the interval width below which evaluation stops;
+    * confidence (float): the confidence level of the interval;
+    * batch_size (int): how many strings are evaluated at a time;
+    * seed (int): the seed of the random order the strings are evaluated in.
+    
+    Returns:
+    * SequentialEstimate: the ratio of the strings evaluated (None if there
+                          are none), its interval, how many strings of the
+                          data were evaluated, and their EvaluationReport
+                          (whose rejected strings are indexed as in data).
+    """
+    order = list(range(len(data)))
+    Random(seed).shuffle(order)
+    interval = [0.0, 1.0]
+    def narrow_enough(accepted, evaluated):
+        interval[:] = wilson_interval(accepted, evaluated, len(data), confidence)
+        return interval[1] - interval[0] < tolerance
+    report = evaluate_stream((data[i] for i in order), check, batch_size, narrow_enough)
+    report = report._replace(rejected = [(order[i], w) for i, w in report.rejected])
+    return SequentialEstimate(report.ratio if report.evaluated else None, *interval, report.evaluated, len(data), report)
 
 # ### Create Dataset
 
@@ -1545,7 +2349,7 @@ assim_one = generate_harmony("assimilation-one", range(2, 8), number = 1000)
 def run_experiment(LEARNER, learner_name, learner_args, learner_kwargs, experiment_name, data, num_samples, evaluator, evaluator_args, evaluator_kwargs):
     this = learner_name + experiment_name
     globals()[this] = LEARNER(*learner_args, **learner_kwargs)
-    globals()[this].data = data +[''] # added to eliminate *>< on all tiers
+    globals()[this].data = chain(data, ['']) # added to eliminate *>< on all tiers
     globals()[this].extract_alphabet()
     globals()[this].learn()
     globals()[this+"_sample"] = globals()[this].generate_sample(n = num_samples)
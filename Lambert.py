@@ -2,14 +2,20 @@
 # coding: utf-8
 
 # # Python Implementation of online TSL learning algorithm as presented in [Lambert (2021)](https://proceedings.mlr.press/v153/lambert21a/lambert21a.pdf)
+#
+# This file was exported from Lambert.ipynb, but is now maintained directly: the notebook does not have what has been added here since.
 
 # ### imports and definitions
 
 # In[1]:
 
 
-from itertools import combinations, product
+from itertools import combinations, islice, product
+from collections import deque, namedtuple
 from tqdm import tqdm
+import ast, asyncio, bz2, codecs, glob, gzip, hashlib, json, lzma, mmap, multiprocessing, os, pickle, random, sys, tempfile, time, warnings, weakref
+from contextlib import contextmanager
+from types import MappingProxyType
 
 # ### Helper Methods
 
@@ -22,7 +28,16 @@ def nsorted(collection, key = lambda x:x):
 	'''
 	if collection.__class__ == dict:
 		return {key:collection[key] for key in nsorted(collection.keys())}
-	return sorted(collection, key = lambda element : (len(key(element)), key(element)))
+	def numerical_key(element):
+		element = key(element)
+		return (len(element), element) if hasattr(element, '__len__') else (0, element) # scalars, such as the symbol ids inside an ITSL grammar's intervener sets, have no length
+	return sorted(collection, key = numerical_key)
+
+def canonical_key(element):
+	'''
+	A sort key under which Sets of Sets come out in one fixed order: a Set is ordered by its own (canonically sorted) elements, rather than by the subset relation, under which Sets of the same size are incomparable
+	'''
+	return tuple(nsorted(element, key = canonical_key)) if element.__class__ == Set else element
 
 # In[3]:
 
@@ -31,23 +46,24 @@ class Set:
 	'''
 	This is just a wrapper class around python's set class, which allows Sets to be placed in other Sets
 	'''
+	__slots__ = ('_set', '_hash', '__weakref__') # grammars hold very many Sets, so they do without a per-instance __dict__
 	def __init__(self, _set = {}):
 		self._set = set(_set)
 		self._rehash()
 
 	def _rehash(self):
-		self._hash = tuple(nsorted(self._set)).__hash__()
+		self._hash = frozenset(self._set).__hash__() # order-independent, so no sorting is needed (and elements need not be sortable)
 	def __hash__(self):
 		if self._hash is None:
 			self._rehash()
 		return self._hash
 
 	def __eq__(self, other):
-		return self.__class__ == other.__class__ and self._set == other._set
+		return self is other or (self.__class__ == other.__class__ and self._set == other._set)
 	def __len__(self):
 		return len(self._set)
 	def __repr__(self):
-		return 'Set({{{0}}})'.format(', '.join(map(repr, nsorted(self._set))))
+		return 'Set({{{0}}})'.format(', '.join(map(repr, nsorted(self._set, key = canonical_key))))
 	def __str__(self):
 		return self.__repr__()
 	def __lt__(self, other):
@@ -79,10 +95,25 @@ class Set:
 
 	def add(self, e):
 		self._set.add(e)
-		self._hash = None; self._ordered = False
+		self._hash = None
 	def update(self, es):
 		self._set.update(es)
-		self._hash = None; self._ordered = False
+		self._hash = None
+
+# Intervener sets are hash-consed: every distinct set of intervening symbols exists exactly once, so that grammars (and successive grammars) share them by reference and comparing two of them is usually an identity check.
+# An interned Set must never be modified in place.
+
+_interned_sets = weakref.WeakValueDictionary()
+
+def intern_set(symbols):
+	'''
+	Returns the canonical Set of the given symbols
+	'''
+	key = frozenset(symbols)
+	interned = _interned_sets.get(key)
+	if interned is None:
+		interned = _interned_sets[key] = Set(key)
+	return interned
 
 # In[4]:
 
@@ -119,6 +150,249 @@ class grammar_tuple(tuple):
     def __len__(self):
         return len(self[1]) + sum(len(item) for item in self[2].values())
 
+@contextmanager
+def atomic_open(path):
+    '''
+    Opens a temporary file in the same directory as path for binary writing, and moves it to path once the block finishes, so that a reader (or a process killed mid-write) never sees a partial file
+    '''
+    directory = os.path.dirname(os.path.abspath(path))
+    descriptor, temporary_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path) + '.')
+    try:
+        with os.fdopen(descriptor, 'wb') as writer:
+            yield writer
+            writer.flush()
+            os.fsync(writer.fileno())
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.unlink(temporary_path)
+        raise
+
+def atomic_write(path, data):
+    '''
+    Writes bytes to path atomically (see atomic_open)
+    '''
+    with atomic_open(path) as writer:
+        writer.write(data)
+
+# ### Corpus readers
+#
+# The learners are online, so a corpus never needs to be held in memory: these readers stream the words of a file (optionally compressed) one at a time, while still reading from disk in large blocks
+
+# In[ ]:
+
+
+_openers = {None: open, 'gzip': gzip.open, 'bz2': bz2.open, 'xz': lzma.open}
+_suffixes = {'.gz': 'gzip', '.bz2': 'bz2', '.xz': 'xz'}
+
+def open_corpus(path, compression='infer'):
+    '''
+    Opens a corpus file for binary reading; compression is one of None, 'gzip', 'bz2', 'xz', or 'infer' (from the file suffix)
+    '''
+    if compression == 'infer':
+        compression = next((kind for suffix, kind in _suffixes.items() if str(path).endswith(suffix)), None)
+    if compression not in _openers:
+        raise ValueError(f"Unknown compression {compression!r}; expected one of {list(_openers)} or 'infer'")
+    return _openers[compression](path, 'rb')
+
+def read_lines(path, encoding='utf-8', compression='infer', keepends=False, chunk_size=1<<20, universal_newlines=False):
+    '''
+    Lazily yields the lines of a corpus file, decoding chunk_size bytes at a time so that memory use does not depend on the size of the corpus.
+    Lines end at '\n' only, unless universal_newlines, when '\r\n' and '\r' end them too (and are yielded as '\n' with keepends), as in the CRLF corpora of natural_data
+    '''
+    decoder = codecs.getincrementaldecoder(encoding)()
+    end = '\n' if keepends else ''
+    with open_corpus(path, compression) as reader:
+        tail = ''
+        while True:
+            chunk = reader.read(chunk_size)
+            text, held = tail + decoder.decode(chunk, final=not chunk), ''
+            if universal_newlines:
+                if chunk and text.endswith('\r'): # the '\n' of a '\r\n' may begin the next chunk
+                    text, held = text[:-1], '\r'
+                text = text.replace('\r\n', '\n').replace('\r', '\n')
+            lines = text.split('\n')
+            tail = lines.pop() + held
+            for line in lines:
+                yield line + end
+            if not chunk:
+                break
+    if tail:
+        yield tail
+
+def mmap_lines(path, encoding='utf-8', keepends=False, universal_newlines=False):
+    '''
+    Lazily yields the lines of an uncompressed corpus file by scanning a memory map of it, so that the operating system pages the file in as needed.
+    universal_newlines is as for read_lines
+    '''
+    with open(path, 'rb') as reader:
+        try:
+            buffer = mmap.mmap(reader.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError: # empty files cannot be mapped
+            return
+        with buffer:
+            start, stop = 0, len(buffer)
+            while start < stop:
+                end = buffer.find(b'\n', start)
+                end = stop if end == -1 else end + 1
+                line = buffer[start:end].decode(encoding)
+                if universal_newlines:
+                    *lines, last = line.replace('\r\n', '\n').replace('\r', '\n').split('\n')
+                    for line in lines:
+                        yield line + '\n' if keepends else line
+                    if last:
+                        yield last
+                else:
+                    yield line if keepends else line.rstrip('\n')
+                start = end
+
+# ### Generation files
+#
+# Generated words are written one per line through a single buffered handle, optionally gzip-compressed, alongside a small JSON index (path + '.index') of the number of lines and, for each word length, the line number and (uncompressed) byte offset of its first word.
+# Since generate_sample produces words shortest first, the index lets a reader go straight to the words of any length, or to any line, without reading the file up to it
+
+# In[ ]:
+
+
+class GenerationWriter:
+    '''
+    Writes words to path, one per line, flushing the file (to disk) and its index every flush_every words and when closed.
+    With offset, an existing uncompressed file is kept up to that byte offset and appended to, as when resuming from a GenerationCursor saved along with tell()
+    '''
+    def __init__(self, path, compression='infer', flush_every=4096, offset=None):
+        self.path = path
+        self.flush_every = flush_every
+        self.lines = 0
+        self.offset = 0
+        self.lengths = dict() # each word length to the line number and byte offset of its first word
+        if compression == 'infer':
+            compression = next((kind for suffix, kind in _suffixes.items() if str(path).endswith(suffix)), None)
+        if offset is not None:
+            if compression is not None:
+                raise ValueError('Only uncompressed generation files can be resumed from an offset')
+            with open(path, 'r+b') as writer:
+                writer.truncate(offset)
+            for line in read_lines(path, keepends=True):
+                self._count(line[:-1], len(line.encode('utf-8')))
+        self._writer = _openers[compression](path, 'ab' if offset is not None else 'wb')
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _count(self, w, size):
+        if len(w) not in self.lengths:
+            self.lengths[len(w)] = (self.lines, self.offset)
+        self.lines += 1
+        self.offset += size
+
+    def write(self, w):
+        line = (w + '\n').encode('utf-8')
+        self._writer.write(line)
+        self._count(w, len(line))
+        if self.lines % self.flush_every == 0:
+            self.flush()
+
+    def tell(self):
+        '''
+        Returns the number of (uncompressed) bytes written so far
+        '''
+        return self.offset
+
+    def flush(self):
+        self._writer.flush()
+        if hasattr(self._writer, 'fileno'):
+            os.fsync(self._writer.fileno())
+        atomic_write(self.path + '.index', json.dumps({'lines': self.lines, 'lengths': self.lengths}).encode('utf-8'))
+
+    def close(self):
+        if not self._writer.closed:
+            self.flush()
+            self._writer.close()
+
+
+class GenerationReader:
+    '''
+    Reads a file of generated words, streaming it rather than reading it whole: iterating yields every word, reader[i] and reader[i:j] (as with a list) only read as far as they need to, starting from the nearest indexed length, and reader.length(j) yields the words of length j
+    '''
+    def __init__(self, path, compression='infer'):
+        self.path = path
+        self.compression = compression
+        self.index = None
+        if os.path.exists(path + '.index'):
+            with open(path + '.index') as reader:
+                self.index = json.load(reader)
+            self.index['lengths'] = {int(length): position for length, position in self.index['lengths'].items()}
+
+    def _words(self, offset=0):
+        with open_corpus(self.path, self.compression) as reader:
+            reader.seek(offset)
+            for encoded in reader:
+                yield encoded[:-1].decode('utf-8') if encoded.endswith(b'\n') else encoded.decode('utf-8')
+
+    def __iter__(self):
+        return self._words()
+
+    def __len__(self):
+        if self.index is not None:
+            return self.index['lines']
+        return sum(1 for _ in self)
+
+    def _words_from(self, start):
+        line, offset = 0, 0
+        if self.index is not None: # begin at the last indexed length starting at or before line start
+            line, offset = max((position for position in self.index['lengths'].values() if position[0] <= start), default=(0, 0))
+        return islice(self._words(offset), start - line, None)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            if (item.start or 0) < 0 or (item.stop or 0) < 0:
+                start, stop, step = item.indices(len(self))
+            else:
+                start, stop, step = item.start or 0, item.stop, item.step or 1
+            return list(islice(self._words_from(start), 0, None if stop is None else max(stop - start, 0), step))
+        if item < 0:
+            item += len(self)
+        for w in self._words_from(item):
+            return w
+        raise IndexError('generation index out of range')
+
+    def length(self, j):
+        '''
+        Yields the words of length j (all of them, if the words are sorted by length as generate_sample writes them)
+        '''
+        if self.index is None:
+            yield from (w for w in self if len(w) == j)
+        elif j in self.index['lengths']:
+            line, offset = self.index['lengths'][j]
+            for w in self._words(offset):
+                if len(w) != j:
+                    return
+                yield w
+
+# ### Throughput figures for the asynchronous API
+
+# In[ ]:
+
+
+class StreamStats:
+    '''
+    Running counts for alearn/ascan_many: words and batches processed, seconds batches spent in the executor, and seconds the reader spent stalled waiting for the executor to finish the previous batch (backpressure)
+    '''
+    def __init__(self):
+        self.words = 0
+        self.batches = 0
+        self.busy_seconds = 0.0
+        self.stalled_seconds = 0.0
+        self.started = time.monotonic()
+    @property
+    def elapsed_seconds(self):
+        return time.monotonic() - self.started
+    @property
+    def words_per_second(self):
+        return self.words / max(self.elapsed_seconds, 1e-9)
+    def __repr__(self):
+        return f'StreamStats(words={self.words}, batches={self.batches}, words_per_second={self.words_per_second:.1f}, busy_seconds={self.busy_seconds:.3f}, stalled_seconds={self.stalled_seconds:.3f})'
+
 # ### Set the standard symbol and dependency widths
 
 # In[7]:
@@ -127,6 +401,8 @@ class grammar_tuple(tuple):
 K = 2 # dependency width
 M = 2 # symbol width
 
+memory_check_interval = 1024 # how many words learn() processes between checks of a learner's memory_limit
+
 # ### Learner definitions/prerequisites
 
 # "$ f : \Sigma^* \rightarrow \mathcal{P} \left( \Sigma^{\leq k+1} \right) $
@@ -154,7 +430,7 @@ def x(w, k=K):
     
 
     augmented_subsequences = dict()         # Create a dictionary from subsequences to the set of their intervener sets
-    augmented_subsequences[()] = Set([Set()]) # The only set of symbols that can intervene a length-0 tuple is the empty set
+    augmented_subsequences[()] = Set([intern_set(())]) # The only set of symbols that can intervene a length-0 tuple is the empty set
 
     for j in range(1, k+1):                                                             # iterate across factor lengths j, 1 to k inclusive
         for subsequence_indices in list(combinations(range(len(w)), j)):                # look at each length-j subsequence of indices
@@ -164,14 +440,14 @@ def x(w, k=K):
                                         for intervening_index in range(subsequence_indices[0], subsequence_indices[-1])
                                         if intervening_index not in subsequence_indices
                                     ]
-            intervening_set = Set(symbols_at_indices(intervening_indices))         # extract the set of symbols at the intervening indices
+            intervening_set = intern_set(symbols_at_indices(intervening_indices))  # extract the (canonical) set of symbols at the intervening indices
 
             if set(subsequence).isdisjoint(set(intervening_set)):           # if there are no symbols shared by the subsequence and the interveners, this is a valid augmented subsequence
                 if subsequence not in augmented_subsequences:
                     augmented_subsequences[subsequence] = Set()
                 augmented_subsequences[subsequence].add(intervening_set)    # add the set of augmented subsequences
 
-    return nsorted(augmented_subsequences)
+    return augmented_subsequences
 
 # "$ r :  \mathcal{P} \left( \Sigma^{\leq k} \times \mathcal{P} \left( \Sigma \right) \right) \rightarrow \mathcal{P} \left( \Sigma^{\leq k} \times \mathcal{P} \left( \Sigma \right) \right)$ restricts the set of augmented subsequences to exclude any that are entailed by any other"
 
@@ -179,7 +455,7 @@ def x(w, k=K):
 
 
 def r(augmented_subsequences):
-    return  nsorted (
+    return  (
                         {
                             subsequence_symbols: Set((
                                                         intervener_symbol_set
@@ -208,11 +484,15 @@ def r(augmented_subsequences):
 
 
 class TSL_Learner:
-    def __init__(self, k=K):
+    def __init__(self, k=K, memory_limit=None, on_memory_limit='raise'):
         self.k = k          # dependency width
-        self.G_l = Set()    # substrings of length bounded above by k+1
-        self.G_s = dict()   # augmented subsequences of length bounded above by k
+        self._G = (Set(), dict())   # G_l, the substrings of length bounded above by k+1, and G_s, the augmented subsequences of length bounded above by k
         self._data_source = None
+        self._frozen = False
+        self._grammar = None    # the canonically ordered grammar last printed or saved, with the G_l and G_s it was made from
+        self._acceptor = None   # likewise for the Acceptor last compiled
+        self.memory_limit = memory_limit        # optional ceiling, in bytes, on memory_usage()['total'], checked while learning
+        self.on_memory_limit = on_memory_limit  # 'raise' (MemoryError) or 'warn' (RuntimeWarning) when the ceiling is exceeded
     def __repr__(self):
         return f'TSL-{self.k} Grammar\n{self.G_l}\n{self.G_s}'
     def __call__(self, *args, **kwargs):
@@ -220,9 +500,28 @@ class TSL_Learner:
     def extract_alphabet(self):
         pass # This algorithm does not require this step for learning :)
 
+    # G_l and G_s are held in one tuple and replaced together, so that a snapshot taken while learning never pairs one version's G_l with another's G_s
+    @property
+    def G_l(self):
+        return self._G[0]
+    @G_l.setter
+    def G_l(self, G_l):
+        self._G = (G_l, self._G[1])
+    @property
+    def G_s(self):
+        return self._G[1]
+    @G_s.setter
+    def G_s(self, G_s):
+        self._G = (self._G[0], G_s)
+
+    # G_l and G_s are unordered while learning; they are put in canonical order only when the grammar is printed or saved, and only once for each version of the grammar
     @property
     def grammar(self):
-        return grammar_tuple((self.k, self.G_l, self.G_s))
+        if self._grammar is None or self._grammar[0] is not self.G_l or self._grammar[1] is not self.G_s:
+            self._grammar = (self.G_l, self.G_s, self._canonical_grammar())
+        return self._grammar[2]
+    def _canonical_grammar(self):
+        return grammar_tuple((self.k, self.G_l, nsorted(dict(self.G_s))))
 
     #This is an online algorithm, so it does not need a persistent copy of the strings it sees. To highlight this, I have enforced that the learner ONLY streams inputs from an iterator, without retaining a pointer to the complete input 
     @property
@@ -233,67 +532,783 @@ class TSL_Learner:
         self._data_source = (w for w in W)
 
 
-    def preprocess(self, w):
+    def preprocess(self, w, learning=False):
         return '>'*(self.k-1) + w + '<'*(self.k-1) # add word-boundary symbols
 
     def scan(self, w_raw):
         w = self.preprocess(w_raw)
+        # r(G_s ∪ x(w)) ⊆ G_s exactly when every augmented subsequence of w is entailed by one in G_s, i.e. has among the intervener sets of its subsequence in G_s a subset of its own, so neither the union nor r need to be built
         return  (
                         f(w, k = self.k).issubset(self.G_l)
                     and
                         all (
-                                (
-                                        subsequence in self.G_s.keys()
-                                    and
-                                        intervening_sets.issubset(self.G_s[subsequence])
-                                )
-                                for subsequence, intervening_sets in r(dictUnion(self.G_s, x(w, self.k))).items()
+                                any (
+                                        entailing_set.issubset(intervening_set)
+                                        for entailing_set in self.G_s.get(subsequence, ())
+                                    )
+                                for subsequence, intervening_sets in x(w, self.k).items()
+                                for intervening_set in intervening_sets
                             )
                 )
     
     def learn_step(self, w_raw):
-        w = self.preprocess(w_raw)
-        self.G_l = self.G_l.union(f(w, k=self.k))
-        self.G_s = r(dictUnion(self.G_s, x(w, self.k)))
+        if self._frozen:
+            raise TypeError("A grammar snapshot is read-only; learn on the learner it was taken from instead")
+        w = self.preprocess(w_raw, learning=True)
+        # The grammar is copy-on-write: G_l, G_s and the Sets inside them are never modified in place, only replaced, and every part of the grammar that w leaves unchanged is shared with the previous grammar (and so with any snapshot of it)
+        G_l, G_s = self._G
+        factors = f(w, k=self.k)
+        if not factors.issubset(G_l):
+            G_l = G_l.union(factors)
+        augmented_subsequences = x(w, self.k)
+        changed = dict()
+        for subsequence, intervening_sets in r(dictUnion({key:G_s[key] for key in augmented_subsequences if key in G_s}, augmented_subsequences)).items():
+            if intervening_sets != G_s.get(subsequence):
+                changed[subsequence] = intervening_sets
+        if changed: # G_s is only copied when an antichain changes, so that a word that teaches nothing keeps the grammar (and what is cached for it) as it was
+            G_s = dict(G_s)
+            G_s.update(changed)
+        if G_l is not self.G_l or G_s is not self.G_s:
+            self._G = (G_l, G_s)
+
+    def snapshot(self):
+        '''
+        Returns a read-only view of the current grammar that can be scanned (and pickled to other processes) while this learner keeps learning.
+        Since learning never modifies the grammar in place, the snapshot shares G_l and every antichain of G_s with the learner instead of copying them
+        '''
+        snapshot = object.__new__(type(self))
+        snapshot.__dict__.update(self.__dict__)
+        G_l, G_s = snapshot._G # as copied, together, with the rest of the learner
+        snapshot._G = (G_l, MappingProxyType(G_s))
+        snapshot._data_source = None
+        snapshot._frozen = True
+        return snapshot
+
+    def acceptor(self):
+        '''
+        Returns the Acceptor of the grammar, compiled once for each version of the grammar
+        '''
+        if self._acceptor is None or self._acceptor[0] is not self.G_l or self._acceptor[1] is not self.G_s:
+            self._acceptor = (self.G_l, self.G_s, Acceptor(self))
+        return self._acceptor[2]
+
+    def counterexample(self, other, symmetric=False):
+        '''
+        Returns a shortest word in the language of other but not of this grammar (or, if symmetric, in exactly one of the two), or None if there is none
+        '''
+        return shortest_difference(other.acceptor(), self.acceptor(), symmetric)
+
+    def includes(self, other):
+        '''
+        Whether every word other accepts, this grammar accepts too (see counterexample for a word showing otherwise)
+        '''
+        return self.counterexample(other) is None
+
+    def equivalent(self, other):
+        '''
+        Whether this grammar and other accept exactly the same words (see counterexample(other, symmetric=True) for a word showing otherwise)
+        '''
+        return self.counterexample(other, symmetric=True) is None
+
+    def fingerprint(self):
+        '''
+        Returns a hex digest of the grammar's content that is the same for any two learners holding the same grammar, however (and in whatever order) they learned it, so that work done for one can be reused for the other
+        '''
+        widths, G_l, G_s = self.grammar # written in symbols rather than the ids an ITSL_Learner assigns in order of appearance
+        canonical = (
+            type(self).__name__,
+            widths,
+            sorted(G_l),
+            sorted((subsequence, sorted(tuple(sorted(intervening_set)) for intervening_set in intervening_sets)) for subsequence, intervening_sets in G_s.items()),
+        )
+        return hashlib.blake2b(repr(canonical).encode('utf-8'), digest_size=16).hexdigest()
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_G'] = (self.G_l, dict(self.G_s)) # mapping proxies cannot be pickled
+        state['_grammar'] = None      # nor can the one the canonical grammar was made from
+        state['_data_source'] = None  # nor can generators
+        state['_acceptor'] = None     # nor can the lambdas of an Acceptor, which is in any case cheap to compile again
+        return state
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self._frozen:
+            self._G = (self.G_l, MappingProxyType(self.G_s))
     
-    def learn(self, W=None):
+    def learn(self, W=None, checkpoint_path=None, checkpoint_every=None, checkpoint_seconds=None, offset=0):
+        '''
+        Learns from every word of W (or of self.data). If checkpoint_path is given, the grammar and the number of words consumed so far are saved there every checkpoint_every words and/or every checkpoint_seconds seconds, as well as once the stream is exhausted; offset is the number of words of the stream already consumed before W
+        '''
         W = (w for w in (W if W is not None else self._data_source))
-        for w in tqdm(W, desc="Learning"):
+        last_checkpoint = time.monotonic()
+        for offset, w in enumerate(tqdm(W, desc="Learning"), start=offset+1):
+            self.learn_step(w)
+            if self.memory_limit is not None and offset % memory_check_interval == 0:
+                self.check_memory()
+            if checkpoint_path is not None and (
+                    (checkpoint_every and offset % checkpoint_every == 0)
+                or
+                    (checkpoint_seconds and time.monotonic() - last_checkpoint >= checkpoint_seconds)
+            ):
+                self.checkpoint(checkpoint_path, offset)
+                last_checkpoint = time.monotonic()
+        if self.memory_limit is not None:
+            self.check_memory()
+        if checkpoint_path is not None:
+            self.checkpoint(checkpoint_path, offset)
+
+    def memory_usage(self):
+        '''
+        Returns the number of bytes held by each component of the grammar: the Set of factors G_l (with its factors), the dict G_s (with its keys and antichains), the intervener sets inside the antichains, and, for an ITSL learner, the symbol table its ids index.
+        Objects shared between components (e.g. symbols) or within them (e.g. interned intervener sets) are counted once, under the first component that holds them
+        '''
+        seen = set()
+        def size(o, deep=True):
+            if id(o) in seen:
+                return 0
+            seen.add(id(o))
+            total = sys.getsizeof(o)
+            if isinstance(o, Set):
+                total += size(o._set, deep)
+            elif deep and isinstance(o, (tuple, set, frozenset)):
+                total += sum(size(e) for e in o)
+            return total
+        usage = {'G_l': size(self.G_l)}
+        usage['G_s'] = size(self.G_s, deep=False) + sum(size(key) for key in self.G_s) + sum(size(antichain, deep=False) for antichain in self.G_s.values())
+        usage['intervener_sets'] = sum(size(intervening_set) for antichain in self.G_s.values() for intervening_set in antichain)
+        if isinstance(self, ITSL_Learner):
+            usage['symbols'] = size(self.symbols, deep=False) + size(self.symbol_ids, deep=False) + sum(size(symbol) + size(symbol_id) for symbol, symbol_id in self.symbol_ids.items())
+        usage['total'] = sum(usage.values())
+        return usage
+
+    def check_memory(self):
+        '''
+        Compares memory_usage() against memory_limit, raising or warning (according to on_memory_limit) if it is exceeded
+        '''
+        usage = self.memory_usage()
+        if usage['total'] > self.memory_limit:
+            message = f"{type(self).__name__} grammar uses {usage['total']} bytes, above its memory_limit of {self.memory_limit} bytes: {usage}"
+            if self.on_memory_limit == 'warn':
+                warnings.warn(message, RuntimeWarning, stacklevel=2)
+            else:
+                raise MemoryError(message)
+        return usage
+
+    def checkpoint(self, path, offset):
+        '''
+        Atomically saves the grammar together with the stream offset it was learned up to
+        '''
+        atomic_write(path, pickle.dumps({'learner': type(self).__name__, 'grammar': tuple(self.grammar), 'offset': offset}))
+
+    @classmethod
+    def resume(cls, checkpoint_path, W, **kwargs):
+        '''
+        Restores the grammar saved at checkpoint_path and continues learning from the same stream W, skipping the words that were already learned
+        '''
+        with open(checkpoint_path, 'rb') as reader:
+            state = pickle.load(reader)
+        if state['learner'] != cls.__name__:
+            raise ValueError(f"{checkpoint_path} holds a {state['learner']} checkpoint, not a {cls.__name__} one")
+        learner = cls.from_grammar(state['grammar'])
+        learner.learn(islice(W, state['offset'], None), checkpoint_path=checkpoint_path, offset=state['offset'], **kwargs)
+        return learner
+
+    @classmethod
+    def from_grammar(cls, grammar):
+        '''
+        Builds a learner holding an existing grammar tuple, as produced by the grammar property
+        '''
+        widths, G_l, G_s = grammar
+        learner = cls(*widths) if isinstance(widths, tuple) else cls(widths)
+        learner.G_l = G_l
+        learner.G_s = {subsequence: Set(map(intern_set, intervening_sets)) for subsequence, intervening_sets in G_s.items()}
+        return learner
+
+    def save(self, path):
+        '''
+        Saves the grammar in the versioned binary format (see write_grammar)
+        '''
+        write_grammar(self, path)
+
+    @classmethod
+    def load(cls, path):
+        '''
+        Reads a grammar saved with save (or, for older files, as str(learner.grammar))
+        '''
+        learner = load_grammar(path)
+        if not isinstance(learner, cls):
+            raise ValueError(f"{path} holds a {type(learner).__name__} grammar, not a {cls.__name__} one")
+        return learner
+
+    def _learn_batch(self, batch):
+        for w in batch:
             self.learn_step(w)
+        if self.memory_limit is not None:
+            self.check_memory()
+
+    async def _pipeline(self, W, batch_size, executor, stats, function, arguments=tuple):
+        '''
+        Reads an async iterable in batches of at most batch_size words and runs function(*arguments(), batch) on each one in executor, yielding (batch, result) pairs in order.
+        The next batch is read while the previous one is being processed, but no further: at most one batch is in flight and one is being gathered, so a slow executor holds up the reader (backpressure) rather than letting words pile up in memory
+        '''
+        loop = asyncio.get_running_loop()
+        words = W.__aiter__()
+        in_flight = None
+        exhausted = False
+        while True:
+            batch = []
+            while not exhausted and len(batch) < batch_size:
+                try:
+                    batch.append(await words.__anext__())
+                except StopAsyncIteration:
+                    exhausted = True
+            if in_flight is not None:
+                previous_batch, future, started = in_flight
+                stalled = time.monotonic()
+                result = await future
+                stats.stalled_seconds += time.monotonic() - stalled
+                stats.busy_seconds += time.monotonic() - started
+                stats.words += len(previous_batch)
+                stats.batches += 1
+                yield previous_batch, result
+            if not batch:
+                return
+            in_flight = (batch, loop.run_in_executor(executor, function, *arguments(), batch), time.monotonic())
 
-    def generate_sample(self, n, use_iterator=False):
-        def generate_with_iterator(n=n):
-            alphabet = set(''.join(''.join(substring) for substring in self.G_l)).difference('<','>')
+    async def alearn(self, W, batch_size=256, executor=None, stats=None):
+        '''
+        Learns from an async iterable without blocking the event loop: words are gathered into bounded batches, each batch is learned in executor (by default the loop's thread pool), and control returns to the loop between batches.
+        Returns the StreamStats of the run (or updates stats, if given)
+        '''
+        stats = StreamStats() if stats is None else stats
+        async for _ in self._pipeline(W, batch_size, executor, stats, self._learn_batch):
+            pass
+        return stats
 
-            j = 0
-            while True:
-                for w in map(''.join, product(alphabet, repeat=j)):
-                    if self.scan(w):
+    async def ascan_many(self, W, batch_size=256, executor=None, stats=None):
+        '''
+        Asynchronously yields scan(w) for every word of an async iterable, in order. Each batch is scanned in executor (which may also be a process pool) against a snapshot of the grammar taken when the batch is dispatched, so learning may continue, e.g. through alearn, in the meantime
+        '''
+        stats = StreamStats() if stats is None else stats
+        async for _, results in self._pipeline(W, batch_size, executor, stats, _scan_batch, lambda: (self.snapshot(),)):
+            for result in results:
+                yield result
+
+    def learn_file(self, path, encoding='utf-8', compression='infer', use_mmap=False):
+        '''
+        Learns from a corpus file with one word per line, streaming the words straight from disk. Lines may end in '\n', '\r\n' or '\r'
+        '''
+        self.learn(mmap_lines(path, encoding, universal_newlines=True) if use_mmap else read_lines(path, encoding, compression, universal_newlines=True))
+
+    def generate_sample(self, n, use_iterator=False, processes=None, prefix_length=1, cursor=None, with_cursor=False):
+        '''
+        Returns the first n grammatical words, shortest first and each length in the order of product(alphabet, repeat=length), as when every candidate was scanned.
+        With processes (a number of worker processes), the words of each length are split by their first prefix_length characters, the parts are found in parallel and merged back in order, and the workers stop as soon as n words are found.
+        With with_cursor, each word comes paired with the GenerationCursor just after it; passing that cursor back continues the same enumeration from there (to n words in all, counting those already generated)
+        '''
+        alphabet = list(set(''.join(''.join(substring) for substring in self.grammar[1])).difference('<','>'))
+        if cursor is None:
+            cursor = GenerationCursor(0, 0, 0, ''.join(alphabet))
+        elif set(cursor.alphabet) != set(alphabet):
+            raise ValueError(f'The cursor enumerates the alphabet {cursor.alphabet!r}, not this grammar\'s {"".join(sorted(alphabet))!r}')
+        alphabet = list(cursor.alphabet) # a set's order changes with the hash seed, so a resumed enumeration keeps the order it began with
+        index = {symbol: i for i, symbol in enumerate(alphabet)}
+        def rank(w): # the position of w in product(alphabet, repeat=len(w))
+            position = 0
+            for symbol in w:
+                position = position*len(alphabet) + index[symbol]
+            return position
+        def word_at(position, length): # the word at position in product(alphabet, repeat=length), or None past the end
+            if position >= len(alphabet)**length:
+                return None
+            w = []
+            for _ in range(length):
+                position, i = divmod(position, len(alphabet))
+                w.append(alphabet[i])
+            return ''.join(reversed(w))
+        first = word_at(cursor.rank, cursor.length) # where the enumeration of the first length resumes
+        def emit(words, generated=cursor.count):
+            for w in words:
+                generated += 1
+                yield (w, GenerationCursor(len(w), rank(w)+1, generated, cursor.alphabet)) if with_cursor else w
+                if generated == n:
+                    return
+
+        def generate_with_iterator():
+            acceptor = self.acceptor()
+            j = cursor.length
+            while acceptor.survives(acceptor.start, j): # once no prefix of length j survives, the language is finite and every word of it has been generated
+                if j > cursor.length or first is not None:
+                    yield from acceptor.words(alphabet, j, first=first if j == cursor.length else None)
+                j += 1
+        def generate_in_parallel(n=n-cursor.count):
+            def partitions():
+                j = cursor.length
+                while True:
+                    for prefix in map(''.join, product(alphabet, repeat=min(j, prefix_length))):
+                        if j > cursor.length or first is not None and rank(prefix) >= rank(first[:len(prefix)]):
+                            yield j, prefix
+                    j += 1
+            partitions = partitions()
+            pool = multiprocessing.Pool(processes, initializer=_start_generation_worker, initargs=(self.snapshot(),))
+            try:
+                pending = deque() # results to come of the next partitions, in order, keeping every worker busy
+                level, surviving = cursor.length, True # the length whose partitions are being merged, and whether any prefix of that length survives (assumed of the length resumed from, some of whose partitions may be skipped)
+                while True:
+                    while len(pending) < 2*processes:
+                        j, prefix = next(partitions)
+                        pending.append((j, pool.apply_async(_generate_partition, (alphabet, j, prefix, n, first if j == cursor.length else None))))
+                    j, result = pending.popleft()
+                    if j != level:
+                        if not surviving: # as in generate_with_iterator, the language is finite and exhausted
+                            return
+                        level, surviving = j, False
+                    words, survives = result.get()
+                    surviving = surviving or survives
+                    for w in words:
                         yield w
                         n -= 1
                         if n == 0:
                             return
-                j += 1
-        return ((lambda x:x) if use_iterator else list)(tqdm(generate_with_iterator(), total=n))
+            finally:
+                pool.terminate() # the workers still enumerating partitions are stopped rather than waited for, since their words are no longer wanted
+                pool.join()
+        generator = emit(generate_with_iterator() if processes is None else generate_in_parallel()) if cursor.count < n else iter(())
+        return ((lambda x:x) if use_iterator else list)(tqdm(generator, total=n, initial=cursor.count))
+
+    def count(self, length):
+        '''
+        Returns the number of grammatical words of the given length.
+        This takes time in proportion to the number of acceptor states that words up to that length reach, which for an ITSL grammar of natural-language data multiplies with every letter
+        (count(10) takes most of a minute for the Finnish-trained grammars), so the lengths counted (and given to sample) should be kept short for those
+        '''
+        acceptor = self.acceptor()
+        return acceptor.completions(acceptor.start, length)
+
+    def sample(self, n, length_distribution, seed=None):
+        '''
+        Returns n words drawn independently: a length from length_distribution, then a word uniformly at random from the grammatical words of that length.
+        length_distribution is a length, a sequence of lengths to choose among uniformly, or a dict from lengths to weights; lengths with no grammatical words are never drawn
+        '''
+        rng = random.Random(seed)
+        acceptor = self.acceptor()
+        alphabet = sorted(acceptor.alphabet) # sorted, so that a seed draws the same words whatever the hash seed
+        if isinstance(length_distribution, int):
+            length_distribution = [length_distribution]
+        if not isinstance(length_distribution, dict):
+            length_distribution = {length: 1 for length in length_distribution}
+        lengths = [length for length, weight in length_distribution.items() if weight > 0 and self.count(length)]
+        if not lengths:
+            raise ValueError(f'The grammar has no words of any length in {list(length_distribution)}')
+        weights = [length_distribution[length] for length in lengths]
+
+        def draw(length):
+            # each next character is chosen with probability proportional to the number of grammatical words it leads to
+            state, w = acceptor.start, []
+            for remaining in range(length-1, -1, -1):
+                rank = rng.randrange(acceptor.completions(state, remaining+1))
+                for character in alphabet:
+                    following = acceptor.step(state, character)
+                    completions = acceptor.completions(following, remaining)
+                    if rank < completions:
+                        break
+                    rank -= completions
+                state = following
+                w.append(character)
+            return ''.join(w)
+        return [draw(length) for length in rng.choices(lengths, weights, k=n)]
+
+def _scan_batch(grammar, batch):
+    return [grammar.scan(w) for w in batch] # module-level, so that it can also be sent to a process pool
+
+# The grammar a generation worker process finds words for, sent once when the process starts
+_generation_grammar = None
+
+def _start_generation_worker(grammar):
+    global _generation_grammar
+    _generation_grammar = grammar
+
+def _generate_partition(alphabet, length, prefix, limit, first=None):
+    '''
+    Returns up to limit grammatical words of the given length that begin with prefix (and come no earlier than first), in order, and whether any prefix of that length beginning with it survives
+    '''
+    acceptor = _generation_grammar.acceptor()
+    return list(islice(acceptor.words(alphabet, length, prefix, first), limit)), acceptor.survives(acceptor.read(acceptor.start, prefix), length - len(prefix))
+
 # In[12]:
 
 
 class ITSL_Learner(TSL_Learner):
-    def __init__(self, k=K, m=M):
-        super().__init__(k)
+    def __init__(self, k=K, m=M, **kwargs):
+        super().__init__(k, **kwargs)
         self.m = m             # symbol width
+        self.symbols = []          # every width-m symbol seen while learning: inside G_l and G_s, a symbol is represented by its index in this list,
+        self.symbol_ids = dict()   # so that factors, subsequences and intervener sets hash and compare small ints rather than strings
     def __repr__(self):
-        return f'ITSL-({self.k}, {self.m}) Grammar\n{self.G_l}\n{self.G_s}'
-    @property
-    def grammar(self):
-        return grammar_tuple(((self.k, self.m), self.G_l, self.G_s))
+        _, G_l, G_s = self.grammar
+        return f'ITSL-({self.k}, {self.m}) Grammar\n{G_l}\n{G_s}'
+    def snapshot(self):
+        snapshot = super().snapshot()
+        snapshot.symbols, snapshot.symbol_ids = list(self.symbols), dict(self.symbol_ids) # the learner keeps adding symbols as it learns; ids are only ever appended, so the copy agrees with the snapshot's grammar
+        return snapshot
+    def _canonical_grammar(self):
+        decode = lambda ids : tuple(self.symbols[i] for i in ids)
+        return grammar_tuple((
+            (self.k, self.m),
+            Set(map(decode, self.G_l)),
+            nsorted({decode(subsequence): Set(Set(decode(intervening_set)) for intervening_set in intervening_sets) for subsequence, intervening_sets in self.G_s.items()}),
+        ))
 
-    def preprocess(self, w):
-        return width_j_substrings( #break string into width-m symbols, i.e. symbols created from m adjacent symbols
+    @classmethod
+    def from_grammar(cls, grammar):
+        (k, m), G_l, G_s = grammar
+        learner = cls(k, m)
+        encode = lambda symbols : tuple(map(learner._symbol_id, symbols))
+        learner.G_l = Set(map(encode, G_l))
+        learner.G_s = {encode(subsequence): Set(intern_set(encode(intervening_set)) for intervening_set in intervening_sets) for subsequence, intervening_sets in G_s.items()}
+        return learner
+
+    def _symbol_id(self, symbol):
+        symbol_id = self.symbol_ids.get(symbol)
+        if symbol_id is None:
+            symbol_id = self.symbol_ids[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+        return symbol_id
+
+    def preprocess(self, w, learning=False):
+        symbols = width_j_substrings( #break string into width-m symbols, i.e. symbols created from m adjacent symbols
             '>'*(self.k*self.m-1) + w + '<'*(self.k*self.m-1), # add word-boundary symbols. Adding k*m-1 ensures that the first k-factor of consecutive m-width symbols contains exactly one true symbol, analogous to adding k-1 word boundary symbols for a TSL learner    
             self.m
         )
+        if learning:
+            return tuple(map(self._symbol_id, symbols))
+        return tuple(self.symbol_ids.get(symbol, -1) for symbol in symbols) # -1 stands for any symbol never seen while learning, which no grammar permits
     
+# Where an enumeration of generate_sample stands: the length of the words being enumerated, the position within product(alphabet, repeat=length) of the next word to consider, the number of words generated so far, and the alphabet, in the order it is enumerated in
+
+GenerationCursor = namedtuple('GenerationCursor', ('length', 'rank', 'count', 'alphabet'))
+
+# ### Acceptors
+#
+# A grammar's language is regular, so it can be read one character at a time by a finite-state acceptor. Its state holds
+#   the last m-1 characters read (ITSL only), which form the next width-m symbol together with the next character,
+#   the last k symbols, whose suffixes together with the next symbol are the factors that must be in G_l,
+#   and the partial subsequences still open: pairs (t, I) of fewer than k chosen symbols and the set of symbols read since the first of them, other than those chosen.
+# Choosing the next symbol a completes the subsequence t+a with interveners I, which must be entailed by some augmented subsequence in G_s (an intervener set J of t+a with J a subset of I); skipping it adds a to I.
+# A partial (t, I) whose interveners came to include a symbol of t can never complete a valid subsequence, and one with a superset of another's interveners for the same t is entailed whenever the other is, so only the minimal interveners of each t are kept.
+# This accepts exactly the words that scan accepts, and the reachable states are finite.
+
+# In[ ]:
+
+
+class Acceptor:
+    '''
+    The finite-state acceptor of a learner's grammar over raw characters (see above). A state is a hashable tuple, and None is the state of words that no continuation can make grammatical
+    '''
+    def __init__(self, learner):
+        self.k = learner.k
+        self.m = learner.m if isinstance(learner, ITSL_Learner) else 1
+        if isinstance(learner, ITSL_Learner):
+            self.symbol_of = learner.symbol_ids.get # width-m strings to ids
+            self.alphabet = set(''.join(learner.symbols)).difference('<', '>')
+        else:
+            self.symbol_of = lambda symbol : symbol
+            self.alphabet = set(''.join(learner.G_l)).difference('<', '>')
+        self.factors = {tuple(factor) for factor in learner.G_l}
+        self.entailing = {subsequence: [frozenset(intervening_set) for intervening_set in intervening_sets] for subsequence, intervening_sets in learner.G_s.items()}
+        self._steps = dict()
+        self._entailments = dict()
+        self._completions = dict()
+        self._survivals = dict()
+        self.start = self.read(('', (), frozenset()), '>'*(self.k*self.m-1)) if self._entailed((), frozenset()) and () in self.factors else None
+
+    def _entailed(self, subsequence, intervening_set):
+        augmented_subsequence = (subsequence, intervening_set)
+        if augmented_subsequence not in self._entailments:
+            self._entailments[augmented_subsequence] = any(entailing_set <= intervening_set for entailing_set in self.entailing.get(subsequence, ()))
+        return self._entailments[augmented_subsequence]
+
+    def read(self, state, characters):
+        '''
+        Returns the state after reading characters in state
+        '''
+        for character in characters:
+            if state is None:
+                return None
+            state = self.step(state, character)
+        return state
+
+    def step(self, state, character):
+        '''
+        Returns the state after reading character in state
+        '''
+        transition = (state, character)
+        if transition not in self._steps:
+            self._steps[transition] = self._step(state, character)
+        return self._steps[transition]
+
+    def _step(self, state, character):
+        characters, window, partials = state
+        characters += character
+        if len(characters) < self.m: # the boundary has not yet filled a whole symbol
+            return (characters, window, partials)
+        a = self.symbol_of(characters)
+        characters = characters[1:]
+        if a is None or not all(window[i:] + (a,) in self.factors for i in range(len(window)+1)):
+            return None
+        if not self._entailed((a,), frozenset()):
+            return None
+        extended = {((a,), frozenset())} if self.k > 1 else set()
+        for subsequence, intervening_set in partials:
+            if a not in intervening_set: # choose a
+                if not self._entailed(subsequence + (a,), intervening_set):
+                    return None
+                if len(subsequence) + 1 < self.k:
+                    extended.add((subsequence + (a,), intervening_set))
+            if a not in subsequence: # skip a
+                extended.add((subsequence, intervening_set | {a}))
+        by_subsequence = dict()
+        for subsequence, intervening_set in extended:
+            by_subsequence.setdefault(subsequence, []).append(intervening_set)
+        minimal = frozenset(
+            (subsequence, intervening_set) for subsequence, intervening_sets in by_subsequence.items() for intervening_set in intervening_sets
+            if not any(other_set < intervening_set for other_set in intervening_sets)
+        )
+        return (characters, (window + (a,))[-self.k:], minimal)
+
+    def completions(self, state, length):
+        '''
+        Returns the number of words of the given length that, read from state, lead to a grammatical word
+        '''
+        if state is None:
+            return 0
+        if (state, length) not in self._completions:
+            if length == 0:
+                self._completions[state, length] = int(self.accepts(state))
+            else:
+                self._completions[state, length] = sum(self.completions(self.step(state, character), length-1) for character in self.alphabet)
+        return self._completions[state, length]
+
+    def survives(self, state, length):
+        '''
+        Whether some continuation of the given length can be read from state without the word becoming ungrammatical (though it need not be grammatical yet)
+        '''
+        if state is None:
+            return False
+        if (state, length) not in self._survivals:
+            self._survivals[state, length] = length == 0 or any(self.survives(self.step(state, character), length-1) for character in self.alphabet)
+        return self._survivals[state, length]
+
+    def words(self, alphabet, length, prefix='', first=None):
+        '''
+        Generates the grammatical words of the given length that begin with prefix, in the order of product(alphabet, repeat=length), depth-first: a prefix is only extended while some word of that length that it begins is grammatical.
+        With first, a word of that length, the words before it in that order are skipped
+        '''
+        def extensions(w, state, remaining, bound):
+            # bound is what remains of first while w is a prefix of it: until w leaves it, no character may come before first's
+            if remaining == 0:
+                yield w
+                return
+            for character in alphabet[alphabet.index(bound[0]):] if bound else alphabet:
+                following = self.step(state, character)
+                if self.completions(following, remaining-1):
+                    yield from extensions(w + character, following, remaining-1, bound[1:] if bound and character == bound[0] else None)
+        state = self.read(self.start, prefix)
+        if self.completions(state, length - len(prefix)):
+            yield from extensions(prefix, state, length - len(prefix), first[len(prefix):] if first is not None and first.startswith(prefix) else None)
+
+    def accepts(self, state):
+        '''
+        Whether a word that led to state is grammatical, i.e. whether state survives the closing word boundary
+        '''
+        return state is not None and self.read(state, '<'*(self.k*self.m-1)) is not None
+
+    def __call__(self, w):
+        return self.accepts(self.read(self.start, w))
+
+
+def shortest_difference(first, second, symmetric=False):
+    '''
+    Returns the shortest (and, among those, alphabetically first) word accepted by the Acceptor first but not by second, or, if symmetric, by exactly one of them; or None if there is none.
+    This is a breadth-first search of the product of the two acceptors
+    '''
+    alphabet = sorted(first.alphabet | second.alphabet if symmetric else first.alphabet)
+    differs = lambda pair : first.accepts(pair[0]) != second.accepts(pair[1]) and (symmetric or first.accepts(pair[0]))
+    start = (first.start, second.start)
+    reached = {start: None} # each pair of states to the pair and character it was first reached from
+    frontier = [start]
+    while frontier:
+        following = []
+        for pair in frontier:
+            if differs(pair):
+                w = []
+                while reached[pair] is not None:
+                    pair, character = reached[pair]
+                    w.append(character)
+                return ''.join(reversed(w))
+            for character in alphabet:
+                successor = tuple(None if state is None else acceptor.step(state, character) for state, acceptor in zip(pair, (first, second)))
+                if successor not in reached and successor != (None, None) and (symmetric or successor[0] is not None):
+                    reached[successor] = (pair, character)
+                    following.append(successor)
+        frontier = following
+    return None
+
+# ### Saved grammars
+#
+# Grammars are saved in a compact binary format (see write_grammar); the older human-readable files, written as str(learner.grammar), can still be read, and dump_grammar.py turns a binary file back into that text.
+#
+# Format, version 1 (every integer is an unsigned LEB128 varint):
+#   magic b'TSLG', version byte, kind byte (0 = TSL, 1 = ITSL), k, and m for ITSL
+#   symbol table: number of symbols, then each symbol as its UTF-8 byte length and bytes; symbols are characters for TSL and width-m strings for ITSL
+#   G_l: number of factors, then each factor as its length and the ids of its symbols
+#   G_s: number of subsequences, then each subsequence as its length and symbol ids, followed by the size of its antichain and each intervener set as a bitmask over symbol ids
+
+# In[ ]:
+
+
+GRAMMAR_MAGIC = b'TSLG'
+GRAMMAR_VERSION = 1
+
+def _varint(n):
+    encoded = bytearray()
+    while n > 0x7f:
+        encoded.append((n & 0x7f) | 0x80)
+        n >>= 7
+    encoded.append(n)
+    return encoded
+
+def _read_varint(buffer, position):
+    n = shift = 0
+    while True:
+        byte = buffer[position]
+        position += 1
+        n |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return n, position
+        shift += 7
+
+def write_grammar(learner, path):
+    '''
+    Saves the grammar of a learner in the binary format, streaming it section by section into a temporary file which replaces path once complete
+    '''
+    itsl = isinstance(learner, ITSL_Learner)
+    if itsl: # the grammar is already expressed in symbol ids
+        symbols, symbol_id = learner.symbols, int
+    else:
+        symbols = sorted({symbol for factor in learner.G_l for symbol in factor})
+        symbol_id = {symbol: i for i, symbol in enumerate(symbols)}.__getitem__
+    encode = lambda sequence : _varint(len(sequence)) + b''.join(_varint(symbol_id(symbol)) for symbol in sequence)
+    mask = lambda intervening_set : sum(1 << symbol_id(symbol) for symbol in intervening_set)
+    with atomic_open(path) as writer:
+        writer.write(GRAMMAR_MAGIC + bytes([GRAMMAR_VERSION, itsl]) + _varint(learner.k) + (_varint(learner.m) if itsl else b''))
+        writer.write(_varint(len(symbols)))
+        for symbol in symbols:
+            encoded = symbol.encode('utf-8')
+            writer.write(_varint(len(encoded)) + encoded)
+        writer.write(_varint(len(learner.G_l)))
+        for factor in nsorted(learner.G_l):
+            writer.write(encode(factor))
+        writer.write(_varint(len(learner.G_s)))
+        for subsequence in nsorted(learner.G_s.keys()):
+            intervening_sets = learner.G_s[subsequence]
+            writer.write(encode(subsequence) + _varint(len(intervening_sets)) + b''.join(_varint(m) for m in sorted(map(mask, intervening_sets))))
+
+def read_grammar(path):
+    '''
+    Reads a grammar file in the binary format and returns a learner of the matching class holding it
+    '''
+    with open(path, 'rb') as reader:
+        buffer = reader.read()
+    if buffer[:4] != GRAMMAR_MAGIC:
+        raise ValueError(f'{path} is not a binary grammar file')
+    if buffer[4] != GRAMMAR_VERSION:
+        raise ValueError(f'{path} is a version {buffer[4]} grammar file; this reader only knows version {GRAMMAR_VERSION}')
+    itsl, position = buffer[5], 6
+    k, position = _read_varint(buffer, position)
+    if itsl:
+        m, position = _read_varint(buffer, position)
+    count, position = _read_varint(buffer, position)
+    symbols = []
+    for _ in range(count):
+        length, position = _read_varint(buffer, position)
+        symbols.append(buffer[position:position+length].decode('utf-8'))
+        position += length
+    if itsl:
+        learner = ITSL_Learner(k, m)
+        learner.symbols, learner.symbol_ids = symbols, {symbol: i for i, symbol in enumerate(symbols)}
+        symbol = int
+        factor_of = tuple
+    else:
+        learner = TSL_Learner(k)
+        symbol = symbols.__getitem__
+        factor_of = ''.join
+    def sequence(position):
+        length, position = _read_varint(buffer, position)
+        ids = []
+        for _ in range(length):
+            i, position = _read_varint(buffer, position)
+            ids.append(symbol(i))
+        return ids, position
+    count, position = _read_varint(buffer, position)
+    G_l = []
+    for _ in range(count):
+        ids, position = sequence(position)
+        G_l.append(factor_of(ids))
+    count, position = _read_varint(buffer, position)
+    G_s = dict()
+    for _ in range(count):
+        subsequence, position = sequence(position)
+        size, position = _read_varint(buffer, position)
+        intervening_sets = []
+        for _ in range(size):
+            bits, position = _read_varint(buffer, position)
+            intervening_sets.append(intern_set(symbol(i) for i in range(bits.bit_length()) if bits >> i & 1))
+        G_s[tuple(subsequence)] = Set(intervening_sets)
+    learner.G_l, learner.G_s = Set(G_l), G_s
+    return learner
+
+def parse_grammar_text(text):
+    '''
+    Parses a grammar written as str(learner.grammar), i.e. a Python literal of tuples, strings, ints, dicts and Set({...}) calls, without evaluating it
+    '''
+    def value(node):
+        if isinstance(node, ast.Constant) and isinstance(node.value, (str, int)):
+            return node.value
+        if isinstance(node, ast.Tuple):
+            return tuple(map(value, node.elts))
+        if isinstance(node, ast.Set):
+            return set(map(value, node.elts))
+        if isinstance(node, ast.Dict):
+            return dict(zip(map(value, node.keys), map(value, node.values)))
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == 'Set' and len(node.args) <= 1 and not node.keywords:
+            return Set(*map(value, node.args))
+        raise ValueError(f'Unexpected {ast.dump(node)} in a grammar file')
+    return value(ast.parse(text, mode='eval').body)
+
+def load_grammar(path):
+    '''
+    Reads a saved grammar, in either the binary or the human-readable text format, and returns a learner of the matching class holding it
+    '''
+    with open(path, 'rb') as reader:
+        binary = reader.read(len(GRAMMAR_MAGIC)) == GRAMMAR_MAGIC
+    if binary:
+        return read_grammar(path)
+    with open(path) as reader:
+        grammar = parse_grammar_text(reader.read())
+    return (ITSL_Learner if isinstance(grammar[0], tuple) else TSL_Learner).from_grammar(grammar)
+
+def trial_grammar_paths(prefix):
+    '''
+    Returns the saved grammar of every trial whose file name begins with prefix, e.g. 'experiments/grammars/tsl1_': for each trial, its binary .grammar file, or else the .txt file of a grammar saved before the binary format.
+    A directory holding both kinds, part way through being migrated, yields every trial once
+    '''
+    paths = dict()
+    for extension in ('.txt', '.grammar'): # a .grammar file replaces the .txt file of the same trial
+        for path in glob.glob(glob.escape(prefix) + '*' + extension):
+            paths[path[:-len(extension)]] = path
+    return [paths[stem] for stem in nsorted(paths)]
+
 
 tsl_args = [TSL_Learner, "tsl", [], {'k':2}]
 itsl_args = [ITSL_Learner, "itsl", [], {'k':2, 'm':2}]
\ No newline at end of file
@@ -0,0 +1,16 @@
+'''
+Prints grammar files (binary, as written by learner.save, or text) in the human-readable form str(learner.grammar), e.g.
+    `python dump_grammar.py experiments/grammars/tsl1_1.grammar > tsl1_1.txt`
+'''
+
+from argparse import ArgumentParser
+
+from Lambert import load_grammar
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Print saved grammars as text')
+    parser.add_argument('grammars', nargs='+', help='grammar files')
+    args = parser.parse_args()
+
+    for path in args.grammars:
+        print(load_grammar(path).grammar)
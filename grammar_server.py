@@ -0,0 +1,179 @@
+'''
+A long-lived local server that keeps learners and their grammars in memory, so that scripts can scan, learn and generate without re-importing Aksenova/Lambert or re-reading grammar files for every run.
+
+Run it with, e.g.,
+    `python grammar_server.py --port 8765 experiments/grammars/tsl1_*.grammar`
+or, to listen on a Unix socket instead of localhost TCP,
+    `python grammar_server.py --unix /tmp/grammars.sock experiments/grammars/tsl1_*.grammar`
+
+Every grammar file is registered under its file name without the extension (e.g. `tsl1_1`). All endpoints take and return JSON:
+    POST /scan      {"grammar": name, "words": [...]}                     -> {"results": [true, false, ...]}
+    POST /learn     {"grammar": name, "words": [...], "kind": "tsl"|"itsl", "k": 2, "m": 2}
+                    (kind, k and m are only used when name is not yet registered)  -> {"size": ...}
+    POST /generate  {"grammar": name, "n": 100}                           -> {"words": [...]}
+    GET  /stats                                                          -> {name: {...}, ...}
+'''
+
+import json, os, socketserver, threading, time
+from argparse import ArgumentParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from Lambert import ITSL_Learner, TSL_Learner, load_grammar
+
+learner_kinds = {'tsl': TSL_Learner, 'itsl': ITSL_Learner}
+
+
+class GrammarRegistry:
+    '''
+    The learners served by a GrammarServer, by name. Scans run lock-free against a snapshot of the grammar, while learning on any one grammar is serialised by a lock of its own
+    '''
+    def __init__(self):
+        self.learners = dict()
+        self.locks = dict()
+        self.counts = dict()
+        self._lock = threading.Lock()
+
+    def _register(self, name, learner):
+        self.learners[name] = learner
+        self.locks[name] = threading.Lock()
+        self.counts[name] = {'scanned': 0, 'learned': 0, 'generated': 0, 'seconds': 0.0}
+
+    def add(self, name, learner):
+        with self._lock:
+            self._register(name, learner)
+
+    def load(self, path, name=None):
+        name = os.path.splitext(os.path.basename(path))[0] if name is None else name
+        self.add(name, load_grammar(path))
+        return name
+
+    def get(self, name):
+        if name not in self.learners:
+            raise LookupError(f'No grammar named {name!r}')
+        return self.learners[name]
+
+    def _count(self, name, action, amount, started):
+        with self._lock:
+            self.counts[name][action] += amount
+            self.counts[name]['seconds'] += time.perf_counter() - started
+
+    def scan(self, name, words):
+        started = time.perf_counter()
+        grammar = self.get(name).snapshot()
+        results = [grammar.scan(w) for w in words]
+        self._count(name, 'scanned', len(words), started)
+        return results
+
+    def learn(self, name, words, kind='tsl', **widths):
+        started = time.perf_counter()
+        with self._lock:
+            if name not in self.learners:
+                if kind not in learner_kinds:
+                    raise ValueError(f'Unknown learner kind {kind!r}; expected one of {list(learner_kinds)}')
+                self._register(name, learner_kinds[kind](**widths))
+        with self.locks[name]:
+            learner = self.get(name)
+            for w in words:
+                learner.learn_step(w)
+        self._count(name, 'learned', len(words), started)
+        return len(learner.grammar)
+
+    def generate(self, name, n):
+        started = time.perf_counter()
+        words = self.get(name).snapshot().generate_sample(n)
+        self._count(name, 'generated', len(words), started)
+        return words
+
+    def stats(self):
+        with self._lock:
+            return {
+                name: dict(self.counts[name], kind=type(learner).__name__, size=len(learner.grammar))
+                for name, learner in self.learners.items()
+            }
+
+
+class GrammarRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1' # keep connections alive between requests
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/stats':
+            self._reply(200, self.server.registry.stats())
+        else:
+            self._reply(404, {'error': f'Unknown endpoint {self.path}'})
+
+    def do_POST(self):
+        registry = self.server.registry
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            if self.path == '/scan':
+                self._reply(200, {'results': registry.scan(request['grammar'], request['words'])})
+            elif self.path == '/learn':
+                widths = {width: request[width] for width in ('k', 'm') if width in request}
+                self._reply(200, {'size': registry.learn(request['grammar'], request['words'], request.get('kind', 'tsl'), **widths)})
+            elif self.path == '/generate':
+                self._reply(200, {'words': registry.generate(request['grammar'], request['n'])})
+            else:
+                self._reply(404, {'error': f'Unknown endpoint {self.path}'})
+        except KeyError as error:
+            self._reply(400, {'error': f'Missing field {error}'})
+        except LookupError as error:
+            self._reply(404, {'error': str(error)})
+        except (TypeError, ValueError) as error:
+            self._reply(400, {'error': str(error)})
+
+    def address_string(self):
+        return self.client_address[0] if self.client_address else 'unix' # Unix socket clients have no address
+
+    def log_message(self, format, *args):
+        pass # per-request logging would dominate the cost of a scan
+
+
+class GrammarServer(ThreadingHTTPServer):
+    '''
+    A threaded HTTP server on localhost (one thread per connection) that serves a GrammarRegistry
+    '''
+    daemon_threads = True
+    def __init__(self, registry, host='127.0.0.1', port=0):
+        self.registry = registry
+        super().__init__((host, port), GrammarRequestHandler)
+
+
+class UnixGrammarServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    '''
+    The same server, listening on a Unix socket
+    '''
+    daemon_threads = True
+    def __init__(self, registry, path):
+        self.registry = registry
+        super().__init__(path, GrammarRequestHandler)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Serve scan/learn/generate requests against grammars held in memory')
+    parser.add_argument('grammars', nargs='*', help='grammar files saved with learner.save (or as str(learner.grammar))')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', help='listen on this Unix socket path instead of host:port')
+    args = parser.parse_args()
+
+    registry = GrammarRegistry()
+    for path in args.grammars:
+        registry.load(path)
+    server = UnixGrammarServer(registry, args.unix) if args.unix else GrammarServer(registry, args.host, args.port)
+    print(f'Serving {len(registry.learners)} grammars on {args.unix or f"{args.host}:{server.server_address[1]}"}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.unix:
+            os.remove(args.unix)
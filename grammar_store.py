@@ -0,0 +1,229 @@
+'''
+A grammar store: many grammars in one file laid out so that it can be memory-mapped and scanned in place, without building any Python objects for G_l or G_s.
+Every process that opens the same store shares the operating system's single page-cache copy of it, so opening a set of trial grammars costs next to nothing and memory does not grow with the number of workers.
+
+Build a store from saved grammar files with, e.g.,
+    `python grammar_store.py experiments/grammars/tsl1.store experiments/grammars/tsl1_*.grammar`
+and use it with
+    with GrammarStore('experiments/grammars/tsl1.store') as store:
+        ratios = [mean(g.scan(w) for w in W) for g in store.values()]
+
+Layout, version 2 (all integers little-endian, except symbol ids inside records, which are big-endian so that records sort bytewise):
+    header: magic b'TSLS', version byte, three padding bytes, number of grammars (uint32)
+    directory: for each grammar, its name as a uint16 byte length and UTF-8 bytes, its 16-byte fingerprint (see TSL_Learner.fingerprint) and the file offset of its section (uint64)
+    each section: kind (0 = TSL, 1 = ITSL), k, m, number of symbols, bytes per bitmask, and the numbers of factors, subsequences and bitmasks (struct '<BBHHHIII'),
+        the symbol table, as uint16 byte lengths and UTF-8 bytes,
+        G_l, as sorted fixed-width records of k+1 uint16 symbol ids padded with 0xFFFF,
+        the keys of G_s, as sorted fixed-width records of k uint16 symbol ids padded with 0xFFFF, each followed by the index and number of its bitmasks (two uint32),
+        and the intervener sets of G_s, as bitmasks over symbol ids
+'''
+
+import mmap, os, struct
+from bisect import bisect_left
+from collections.abc import Mapping
+
+from Lambert import ITSL_Learner, atomic_open, f, load_grammar, nsorted, width_j_substrings, x
+
+STORE_MAGIC = b'TSLS'
+STORE_VERSION = 2
+_header = struct.Struct('<4sB3xI')
+_section = struct.Struct('<BBHHHIII')
+_span = struct.Struct('<II')
+_padding = 0xFFFF
+
+
+def _record(ids, width):
+    ids = tuple(ids)
+    return b''.join(i.to_bytes(2, 'big') for i in ids) + b'\xff\xff' * (width - len(ids))
+
+def _encode_section(learner):
+    itsl = isinstance(learner, ITSL_Learner)
+    if itsl: # the grammar is already expressed in symbol ids
+        symbols, symbol_id = learner.symbols, int
+    else:
+        symbols = sorted({symbol for factor in learner.G_l for symbol in factor} | {symbol for subsequence in learner.G_s for symbol in subsequence})
+        symbol_id = {symbol: i for i, symbol in enumerate(symbols)}.__getitem__
+    if len(symbols) >= _padding:
+        raise ValueError(f'A grammar store holds at most {_padding - 1} symbols per grammar, not {len(symbols)}')
+    k, m = learner.k, learner.m if itsl else 1
+    mask_bytes = (len(symbols) + 7) // 8 or 1
+    factors = sorted(_record(map(symbol_id, factor), k+1) for factor in learner.G_l)
+    keys, masks = [], []
+    for subsequence in sorted(learner.G_s, key=lambda subsequence : _record(map(symbol_id, subsequence), k)):
+        intervening_sets = learner.G_s[subsequence]
+        keys.append(_record(map(symbol_id, subsequence), k) + _span.pack(len(masks), len(intervening_sets)))
+        masks.extend(sorted(sum(1 << symbol_id(symbol) for symbol in intervening_set) for intervening_set in intervening_sets))
+    section = bytearray(_section.pack(itsl, k, m, len(symbols), mask_bytes, len(factors), len(keys), len(masks)))
+    for symbol in symbols:
+        encoded = symbol.encode('utf-8')
+        section += len(encoded).to_bytes(2, 'little') + encoded
+    section += b''.join(factors) + b''.join(keys) + b''.join(mask.to_bytes(mask_bytes, 'little') for mask in masks)
+    return section
+
+def write_store(path, learners):
+    '''
+    Atomically writes a store holding the grammars of learners, a mapping from names to learners
+    '''
+    names = [name.encode('utf-8') for name in learners]
+    offset = _header.size + sum(2 + len(name) + 16 + 8 for name in names)
+    sections, directory = [], bytearray()
+    for name, learner in zip(names, learners.values()):
+        offset += -offset % 8 # sections start on 8-byte boundaries
+        section = _encode_section(learner)
+        directory += len(name).to_bytes(2, 'little') + name + bytes.fromhex(learner.fingerprint()) + offset.to_bytes(8, 'little')
+        sections.append((offset, section))
+        offset += len(section)
+    with atomic_open(path) as writer:
+        position = writer.write(_header.pack(STORE_MAGIC, STORE_VERSION, len(names)) + directory)
+        for offset, section in sections:
+            position += writer.write(b'\0' * (offset - position))
+            position += writer.write(section)
+
+def build_store(path, grammar_paths):
+    '''
+    Writes a store holding the grammars saved at grammar_paths, each named after its file name without the extension
+    '''
+    write_store(path, {os.path.splitext(os.path.basename(grammar_path))[0]: load_grammar(grammar_path) for grammar_path in nsorted(grammar_paths)})
+
+
+class _Records:
+    '''
+    A read-only sequence view of fixed-width records in a buffer, comparing by their first key_width bytes, so that bisect can search it in place
+    '''
+    def __init__(self, buffer, offset, count, width, key_width):
+        self.buffer, self.offset, self.count, self.width, self.key_width = buffer, offset, count, width, key_width
+    def __len__(self):
+        return self.count
+    def __getitem__(self, index):
+        start = self.offset + index * self.width
+        return bytes(self.buffer[start:start+self.key_width])
+    def find(self, key):
+        '''
+        Returns the index of the record whose key is key, or -1 if there is none
+        '''
+        index = bisect_left(self, key)
+        return index if index < self.count and self[index] == key else -1
+
+
+class MappedGrammar:
+    '''
+    One grammar of a GrammarStore, scanned directly against the mapped file
+    '''
+    def __init__(self, store, name, fingerprint, offset):
+        self.store, self.name, self._fingerprint = store, name, fingerprint
+        buffer = store.buffer
+        kind, self.k, self.m, count, self.mask_bytes, factors, keys, masks = _section.unpack_from(buffer, offset)
+        self.kind = ('tsl', 'itsl')[kind]
+        position = offset + _section.size
+        self.symbols = []
+        for _ in range(count):
+            length = int.from_bytes(buffer[position:position+2], 'little')
+            self.symbols.append(str(buffer[position+2:position+2+length], 'utf-8'))
+            position += 2 + length
+        self.symbol_ids = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self.factors = _Records(buffer, position, factors, 2*(self.k+1), 2*(self.k+1))
+        position += factors * self.factors.width
+        self.keys = _Records(buffer, position, keys, 2*self.k + _span.size, 2*self.k)
+        self.masks = position + keys * self.keys.width
+    def __repr__(self):
+        return f'{self.name}: {self.kind.upper()}-{self.k} grammar mapped from {self.store.path}'
+    def __call__(self, *args, **kwargs):
+        return self.scan(*args, **kwargs)
+    def __reduce__(self): # a worker process maps the store itself rather than receiving a copy of the grammar
+        return _open_mapped, (self.store.path, self.name)
+    def fingerprint(self):
+        '''
+        Returns the fingerprint of the grammar, as TSL_Learner.fingerprint does for the learner it was stored from
+        '''
+        return self._fingerprint
+
+    def preprocess(self, w):
+        if self.kind == 'itsl':
+            symbols = width_j_substrings('>'*(self.k*self.m-1) + w + '<'*(self.k*self.m-1), self.m)
+        else:
+            symbols = '>'*(self.k-1) + w + '<'*(self.k-1)
+        return tuple(self.symbol_ids.get(symbol, -1) for symbol in symbols) # -1 stands for any symbol the grammar has never seen
+
+    def _intervening_masks(self, key):
+        index = self.keys.find(key)
+        if index < 0:
+            return ()
+        start, count = _span.unpack_from(self.store.buffer, self.keys.offset + index*self.keys.width + self.keys.key_width)
+        position, width = self.masks + start*self.mask_bytes, self.mask_bytes
+        return [int.from_bytes(self.store.buffer[position + i*width:position + (i+1)*width], 'little') for i in range(count)]
+
+    def scan(self, w_raw):
+        '''
+        Accepts w iff every factor of w is in G_l and every valid augmented subsequence of w is entailed by (has an intervener set containing) some augmented subsequence in G_s,
+        which is the same language as TSL_Learner.scan
+        '''
+        w = self.preprocess(w_raw)
+        if -1 in w:
+            return False
+        if any(self.factors.find(_record(factor, self.k+1)) < 0 for factor in f(w, self.k)):
+            return False
+        for subsequence, intervening_sets in x(w, self.k).items():
+            masks = self._intervening_masks(_record(subsequence, self.k))
+            for intervening_set in intervening_sets:
+                allowed = ~sum(1 << symbol for symbol in intervening_set)
+                if not any(mask & allowed == 0 for mask in masks):
+                    return False
+        return True
+
+
+class GrammarStore(Mapping):
+    '''
+    A read-only mapping from names to the MappedGrammars in a store file
+    '''
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as reader:
+            self.buffer = memoryview(mmap.mmap(reader.fileno(), 0, access=mmap.ACCESS_READ))
+        magic, version, count = _header.unpack_from(self.buffer)
+        if magic != STORE_MAGIC:
+            raise ValueError(f'{path} is not a grammar store')
+        if version != STORE_VERSION:
+            raise ValueError(f'{path} is a version {version} grammar store; this reader only knows version {STORE_VERSION}')
+        self.grammars, position = dict(), _header.size
+        for _ in range(count):
+            length = int.from_bytes(self.buffer[position:position+2], 'little')
+            name = str(self.buffer[position+2:position+2+length], 'utf-8')
+            position += 2 + length
+            fingerprint = self.buffer[position:position+16].hex()
+            offset = int.from_bytes(self.buffer[position+16:position+24], 'little')
+            self.grammars[name] = MappedGrammar(self, name, fingerprint, offset)
+            position += 24
+    def __getitem__(self, name):
+        return self.grammars[name]
+    def __iter__(self):
+        return iter(self.grammars)
+    def __len__(self):
+        return len(self.grammars)
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc_info):
+        self.close()
+    def close(self):
+        '''
+        Unmaps the store; its grammars can no longer be scanned
+        '''
+        self.grammars.clear()
+        mapping = self.buffer.obj
+        self.buffer.release()
+        mapping.close()
+
+_open_stores = dict()
+def _open_mapped(path, name):
+    version = (path, os.stat(path).st_mtime_ns) # a rebuilt store is mapped afresh
+    if version not in _open_stores:
+        _open_stores[version] = GrammarStore(path)
+    return _open_stores[version][name]
+
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+    parser = ArgumentParser(description='Write saved grammars into one memory-mappable grammar store')
+    parser.add_argument('store', help='the store file to write')
+    parser.add_argument('grammars', nargs='+', help='grammar files saved with learner.save (or as str(learner.grammar))')
+    args = parser.parse_args()
+    build_store(args.store, args.grammars)
@@ -77,7 +77,8 @@ with open(f"{out_dir}/ratio/{this}.txt", "w") as writer:
 # # # # #
 
 from sys import argv
-learner_id, experiment_id = map(int, argv[1:])
+learner_id, experiment_id = map(int, argv[1:3])
+tolerance = float(argv[3]) if len(argv) > 3 else None # if given, each grammar scans the target strings only until the interval of its ratio is narrower than this
 
 import sys
 from io import StringIO
@@ -88,9 +89,6 @@ from Aksenova import *
 sys.stdout = stdout
 temp_stdout.close()
 
-import Lambert
-from Lambert import Set
-
 out_dir = "experiments"
 
 learner_name = ["tsl", "itsl"][learner_id]# # # # # [tsl_args , itsl_args][learner_id]
@@ -102,25 +100,23 @@ experiment_name, data, num_samples, evaluator, evaluator_args, evaluator_kwargs
 this = learner_name + experiment_name
 
 
-from glob import glob
-G = []
+import os
+from Lambert import trial_grammar_paths
+from grammar_store import GrammarStore, build_store
 
 from tqdm import tqdm
 
-#read in grammars
-for file_path in glob(f"{out_dir}/grammars/{this}_*.txt"):
-    with open(file_path) as reader:
-        g = (Lambert.TSL_Learner if (learner_name == "tsl") else Lambert.ITSL_Learner)()
-        grammar_as_string = reader.read()
-        grammar_tuple = eval(grammar_as_string) # I know this is bad! But saving to a string instead of, say, pickle allows the grammars to be human-readable on the disk
-        if learner_name == "tsl":
-            g.k = grammar_tuple[0]
-        else:
-            g.k, g.m = grammar_tuple[0]
-        g.G_l = grammar_tuple[1]
-        g.G_s = grammar_tuple[2]
-
-        G.append(g)
+#read in grammars, gathered once into a store that is memory-mapped rather than parsed
+grammar_paths = trial_grammar_paths(f"{out_dir}/grammars/{this}_") # each trial's .grammar file, or the text file of one saved before the binary format
+store_path = f"{out_dir}/grammars/{this}.store"
+def store_is_current():
+    if not os.path.exists(store_path) or any(os.path.getmtime(file_path) > os.path.getmtime(store_path) for file_path in grammar_paths):
+        return False
+    with GrammarStore(store_path) as store: # trials deleted or renamed since the store was built must not still be scanned
+        return set(store) == {os.path.splitext(os.path.basename(file_path))[0] for file_path in grammar_paths}
+if not store_is_current():
+    build_store(store_path, grammar_paths)
+G = list(GrammarStore(store_path).values())
 
 
 from statistics import mean, stdev
@@ -131,16 +127,34 @@ with open(f"{out_dir}/target_strings/{experiment_name}.txt",) as reader:
     W += reader.read().splitlines()
 
 #get ratio evaluator function
-def evaluator_function(g, W):
-    return mean(g.scan(w) for w in W)
-
-ratios = [evaluator_function(g, W) for g in G]
+def evaluator_function(g):
+    return lambda batch : [g.scan(w) for w in batch]
+
+unique_grammars = {g.fingerprint(): g for g in G} # trials that learned the same grammar are scanned once
+if tolerance is None:
+    unique_reports = {fingerprint: evaluate_stream(W, evaluator_function(g)) for fingerprint, g in unique_grammars.items()}
+else:
+    unique_estimates = {fingerprint: sequential_evaluator(W, evaluator_function(g), tolerance) for fingerprint, g in unique_grammars.items()}
+    unique_reports = {fingerprint: estimate.report for fingerprint, estimate in unique_estimates.items()}
+unique_ratios = {fingerprint: report.ratio for fingerprint, report in unique_reports.items()}
+ratios = [unique_ratios[g.fingerprint()] for g in G]
 ratio = mean(ratios)
 ratio_stdev = 0.0 if len(ratios) < 2 else stdev(ratios)
 
+evaluated, seconds = sum(report.evaluated for report in unique_reports.values()), sum(report.stats.busy_seconds for report in unique_reports.values())
+print(this, "scanned", evaluated, "strings", f"({evaluated / max(seconds, 1e-9):.0f} strings/s)")
 print(this, "completeness:", f"{ratio*100}% ({ratio_stdev*100}%)")
+if tolerance is not None:
+    estimates = [unique_estimates[g.fingerprint()] for g in G]
+    low, high = mean(estimate.low for estimate in estimates), mean(estimate.high for estimate in estimates)
+    print(this, "completeness interval:", f"[{low*100}%, {high*100}%]", f"after {sum(e.evaluated for e in unique_estimates.values())} of {sum(e.total for e in unique_estimates.values())} strings")
 
 with open(f"{out_dir}/ratio_completeness/{this}.txt", "w") as writer:
     writer.write(str(ratio))
     writer.write("\n")
-    writer.write(str(ratio_stdev))
\ No newline at end of file
+    writer.write(str(ratio_stdev))
+    if tolerance is not None:
+        writer.write("\n")
+        writer.write(str(low))
+        writer.write("\n")
+        writer.write(str(high))
\ No newline at end of file
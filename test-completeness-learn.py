@@ -38,39 +38,16 @@ for w in globals()[this].generate_sample(num_strings, use_iterator=True):
 '''
 # # # Start replacement segment
 #load in all the strings that the learner was trained on 
-train_data = set()
-with open(f"{out_dir}/input_data/{this}_{trial_id}.txt", "r") as reader:
-    for line in reader.readlines():
-        line = line.strip('\n')
-        train_data.add(line)
-def in_train_data(w):
-    return w in train_data
+train_data = set(read_lines(f"{out_dir}/input_data/{this}_{trial_id}.txt", universal_newlines=True))
 
-#generate instances from target grammar
-def evaluator_function(w):
-    return evaluator([w], *evaluator_args, **evaluator_kwargs)
+#generate instances from target grammar, walking its finite-state evaluator so that only well-formed strings are ever built
+target = target_evaluator(evaluator, *evaluator_args, **evaluator_kwargs)
 
 def generate_from_evaluator(n, use_iterator=False, skip_train_instances=True):
-    def generate_with_iterator(n=n):
-        alphabet=set(''.join(train_data))
-        j = 0
-        while True:
-            for w in map(''.join, product(alphabet, repeat=j)):
-                if evaluator_function(w) and (True if not skip_train_instances else not in_train_data(w)):
-                    yield w
-                    n -= 1
-                    if n == 0:
-                        return
-            j += 1
-    return ((lambda x:x) if use_iterator else list)(tqdm(generate_with_iterator(), total=n))
+    alphabet=set(''.join(train_data))
+    generator = islice(target_words(target, alphabet, train_data if skip_train_instances else ()), n)
+    return ((lambda x:x) if use_iterator else list)(tqdm(generator, total=n))
 
 with open(f"{out_dir}/target_strings/{experiment_name}.txt", "w") as writer:
-    writer.write('')
-
-print_real = print; print = lambda *args, **kwargs : None #need to silence prints by evaluator function
-
-for w in generate_from_evaluator(num_strings, use_iterator=True):
-    with open(f"{out_dir}/target_strings/{experiment_name}.txt", "a") as writer:
-        writer.write(w + '\n')
-
-print = print_real
\ No newline at end of file
+    for w in generate_from_evaluator(num_strings, use_iterator=True):
+        writer.write(w + '\n')
\ No newline at end of file
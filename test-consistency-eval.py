@@ -1,5 +1,6 @@
 from sys import argv
-learner_id, experiment_id = map(int, argv[1:])
+learner_id, experiment_id = map(int, argv[1:3])
+tolerance = float(argv[3]) if len(argv) > 3 else None # if given, each generation is evaluated only until the interval of its ratio is narrower than this
 
 import sys
 from io import StringIO
@@ -22,15 +23,27 @@ this = learner_name + experiment_name
 
 
 from glob import glob
+import hashlib
+from Lambert import GenerationReader
 W = []
+keys = []
 
 from tqdm import tqdm
 
 for file_path in glob(f"{out_dir}/generations/{this}_*.txt"):
-    with open(file_path) as reader:
-        W.append(reader.read().splitlines())
+    W.append(GenerationReader(file_path)) # streamed, so that only the evaluated words are read
+    # trials with the same grammar share their generation (see test-consistency-learn.py), so the same evaluated words are the same generation
+    keys.append(hashlib.blake2b('\n'.join(W[-1][:5000]).encode('utf-8')).hexdigest())
 #ratios = [evaluator(tqdm([i[:5000]]), *evaluator_args, **evaluator_kwargs) for i in W]
-ratios = list(tqdm([evaluator(i[:5000], *evaluator_args, **evaluator_kwargs) for i in W]))
+unique = {key: ww for key, ww in zip(keys, W)} # evaluate each distinct generation once
+check = checker(evaluator, *evaluator_args, **evaluator_kwargs) # every string is checked once, for the ratio and the list of failures together
+if tolerance is None:
+    unique_reports = dict(zip(unique, tqdm([evaluate_stream(ww[:5000], check) for ww in unique.values()])))
+else:
+    unique_estimates = dict(zip(unique, tqdm([sequential_evaluator(ww[:5000], check, tolerance) for ww in unique.values()])))
+    unique_reports = {key: estimate.report for key, estimate in unique_estimates.items()}
+unique_ratios = {key: report.ratio for key, report in unique_reports.items()}
+ratios = [unique_ratios[key] for key in keys]
 
 from statistics import mean, stdev
 
@@ -38,16 +51,26 @@ ratio = mean(ratios)
 ratio_stdev = 0.0 if len(ratios) < 2 else stdev(ratios)
 
 # # # 
-for ww in W:
-    for w in ww:
-        if not evaluator([w], *evaluator_args, **evaluator_kwargs):
-            print(w)
+for report in unique_reports.values():
+    for _, w in report.rejected:
+        print(w)
 # # #
 
 
+evaluated, seconds = sum(report.evaluated for report in unique_reports.values()), sum(report.stats.busy_seconds for report in unique_reports.values())
+print(this, "evaluated", evaluated, "strings", f"({evaluated / max(seconds, 1e-9):.0f} strings/s)")
 print(this, "consistency:", f"{ratio*100}% ({ratio_stdev*100}%)")
+if tolerance is not None:
+    estimates = [unique_estimates[key] for key in keys]
+    low, high = mean(estimate.low for estimate in estimates), mean(estimate.high for estimate in estimates)
+    print(this, "consistency interval:", f"[{low*100}%, {high*100}%]", f"after {sum(e.evaluated for e in unique_estimates.values())} of {sum(e.total for e in unique_estimates.values())} strings")
 
 with open(f"{out_dir}/ratio_consistency/{this}.txt", "w") as writer:
     writer.write(str(ratio))
     writer.write("\n")
-    writer.write(str(ratio_stdev))
\ No newline at end of file
+    writer.write(str(ratio_stdev))
+    if tolerance is not None:
+        writer.write("\n")
+        writer.write(str(low))
+        writer.write("\n")
+        writer.write(str(high))
\ No newline at end of file
@@ -1,8 +1,11 @@
 from sys import argv
-learner_id, experiment_id, trial_id, num_strings = map(int, argv[1:])
+learner_id, experiment_id, trial_id, num_strings, *processes = map(int, argv[1:])
+processes = processes[0] if processes else None # generating across this many processes is opt-in, as test-consistency-learn.sh already runs every trial at once
 
 from Aksenova import *
 from Lambert import *
+from itertools import chain
+import fcntl, json, os, shutil, time
 
 out_dir = "experiments"
 
@@ -15,20 +18,59 @@ experiment_name, data, num_samples, evaluator, evaluator_args, evaluator_kwargs
 
 this = learner_name + experiment_name
 
-with open(f"{out_dir}/input_data/{this}_{trial_id}.txt", "w") as writer:
-    for w in data:
-        writer.write(w + '\n')
+checkpoint_path = f"{out_dir}/checkpoints/{this}_{trial_id}.ckpt"
+grammar_path = f"{out_dir}/grammars/{this}_{trial_id}.grammar" # python dump_grammar.py <file> prints it as text
+partial_path = f"{out_dir}/generations/{this}_{trial_id}.txt.partial"
+cursor_path = f"{out_dir}/generations/{this}_{trial_id}.cursor"
+os.makedirs(f"{out_dir}/checkpoints", exist_ok=True)
 
-globals()[this] = LEARNER(*learner_args, **learner_kwargs)
-globals()[this].data = data +[''] # added to eliminate *>< on all tiers
-globals()[this].extract_alphabet()
-globals()[this].learn()
+if os.path.exists(cursor_path): # a previous run was interrupted while generating, so carry on with the grammar it learned
+    globals()[this] = LEARNER.load(grammar_path)
+else:
+    if os.path.exists(checkpoint_path): # a previous run was interrupted while learning, so continue it on the data it was learning from
+        globals()[this] = LEARNER.resume(checkpoint_path, chain(read_lines(f"{out_dir}/input_data/{this}_{trial_id}.txt"), ['']), checkpoint_seconds=60)
+    else:
+        with open(f"{out_dir}/input_data/{this}_{trial_id}.txt", "w") as writer:
+            for w in data:
+                writer.write(w + '\n')
 
-with open(f"{out_dir}/grammars/{this}_{trial_id}.txt", "w") as writer:
-    writer.write(str(globals()[this].grammar))
+        globals()[this] = LEARNER(*learner_args, **learner_kwargs)
+        globals()[this].data = chain(data, ['']) # added to eliminate *>< on all tiers
+        globals()[this].extract_alphabet()
+        globals()[this].learn(checkpoint_path=checkpoint_path, checkpoint_seconds=60)
 
-with open(f"{out_dir}/generations/{this}_{trial_id}.txt", "w") as writer:
-    writer.write('')
-for w in globals()[this].generate_sample(num_strings, use_iterator=True):
-    with open(f"{out_dir}/generations/{this}_{trial_id}.txt", "a") as writer:
-        writer.write(w + '\n')
\ No newline at end of file
+    globals()[this].save(grammar_path)
+    os.remove(checkpoint_path)
+
+# trials that learned the same grammar share one generation, cached under the grammar's fingerprint
+shared_path = f"{out_dir}/generations/by_fingerprint/{globals()[this].fingerprint()}_{num_strings}.txt"
+lock_path = shared_path + '.lock'
+os.makedirs(f"{out_dir}/generations/by_fingerprint", exist_ok=True)
+
+# test-consistency-learn.sh starts every trial at once, so the trials take turns holding a lock on the shared generation: the first to hold it writes the generation, and the others, once they hold it, find it written.
+# The lock is released when its holder's process ends, even if it dies part way through, so the next trial then writes the generation instead
+with open(lock_path, 'a') as lock:
+    fcntl.flock(lock, fcntl.LOCK_EX)
+    if not os.path.exists(shared_path):
+        # the generation is written to a file of this trial's own, and every minute the cursor of the enumeration is saved with the length of that file, so that an interrupted run continues from its last cursor
+        cursor = None
+        if os.path.exists(cursor_path) and os.path.exists(partial_path):
+            with open(cursor_path) as reader:
+                saved = json.load(reader)
+            cursor = GenerationCursor(**saved['cursor'])
+        with GenerationWriter(partial_path, offset=saved['offset'] if cursor else None) as writer: # dropping any words written after the cursor was saved
+            saved_at = time.time()
+            for w, cursor in globals()[this].generate_sample(num_strings, use_iterator=True, processes=processes, cursor=cursor, with_cursor=True):
+                writer.write(w)
+                if time.time() - saved_at > 60:
+                    writer.flush()
+                    atomic_write(cursor_path, json.dumps({'cursor': cursor._asdict(), 'offset': writer.tell()}).encode('utf-8'))
+                    saved_at = time.time()
+        os.replace(partial_path + '.index', shared_path + '.index')
+        os.replace(partial_path, shared_path)
+# once the shared generation is in place (whether written here or by another trial), nothing is left to resume, and a leftover cursor would make the next run skip learning
+for leftover_path in (cursor_path, partial_path, partial_path + '.index'):
+    if os.path.exists(leftover_path):
+        os.remove(leftover_path)
+shutil.copyfile(shared_path + '.index', f"{out_dir}/generations/{this}_{trial_id}.txt.index")
+shutil.copyfile(shared_path, f"{out_dir}/generations/{this}_{trial_id}.txt")
\ No newline at end of file
@@ -0,0 +1,77 @@
+from sys import argv
+learner_id, experiment_id, *max_length = map(int, argv[1:])
+
+import sys
+from io import StringIO
+stdout = sys.stdout
+temp_stdout = StringIO()
+sys.stdout = temp_stdout
+from Aksenova import *
+sys.stdout = stdout
+temp_stdout.close()
+
+out_dir = "experiments"
+
+learner_name = ["tsl", "itsl"][learner_id]# # # # # [tsl_args , itsl_args][learner_id]
+experiment = experiments[experiment_id]['args']
+
+
+experiment_name, data, num_samples, evaluator, evaluator_args, evaluator_kwargs = experiment
+
+this = learner_name + experiment_name
+
+# the words of every length up to max_length are counted, by default up to the longest training word but no further than DEFAULT_MAX_LENGTH:
+# the states an ITSL grammar's acceptor reaches multiply with the length of the words (itsl5_0 takes 0.4s up to length 6, 6s up to 8 and 30s up to 10),
+# so counting up to the longest words of natural-language data (44 letters for Finnish) would never finish. A larger bound can still be given explicitly
+DEFAULT_MAX_LENGTH = 8
+max_length = max_length[0] if max_length else min(max(map(len, data)), DEFAULT_MAX_LENGTH)
+
+
+import os
+from Lambert import load_grammar, read_lines, trial_grammar_paths
+
+from tqdm import tqdm
+
+#the target language, as a finite-state evaluator
+target = target_evaluator(evaluator, *evaluator_args, **evaluator_kwargs)
+
+#read in grammars (grammars saved before the binary format are text)
+grammar_paths = trial_grammar_paths(f"{out_dir}/grammars/{this}_")
+
+from statistics import mean, stdev
+
+consistencies, completenesses = [], []
+overlaps = dict() # trials that learned the same grammar are counted once
+for grammar_path in tqdm(grammar_paths):
+    g = load_grammar(grammar_path)
+    fingerprint = g.fingerprint()
+    if fingerprint not in overlaps:
+        overlaps[fingerprint] = exact_overlap(g, target, max_length)
+    overlap = overlaps[fingerprint]
+    consistencies.append(exact_consistency(overlap))
+
+    #as with the target strings of test-completeness-learn.py, completeness is measured on the words the trial was not trained on
+    trial = os.path.splitext(os.path.basename(grammar_path))[0]
+    if os.path.exists(f"{out_dir}/input_data/{trial}.txt"):
+        overlap = exclude_words(overlap, g, target, read_lines(f"{out_dir}/input_data/{trial}.txt"))
+    completenesses.append(exact_completeness(overlap))
+
+def summarise(ratios):
+    ratios = [ratio for ratio in ratios if ratio is not None] # an empty language has no ratio
+    if not ratios:
+        return None, None
+    return mean(ratios), 0.0 if len(ratios) < 2 else stdev(ratios)
+
+consistency, consistency_stdev = summarise(consistencies)
+completeness, completeness_stdev = summarise(completenesses)
+
+print(this, f"up to length {max_length}")
+print(this, "exact consistency:", "-" if consistency is None else f"{consistency*100}% ({consistency_stdev*100}%)")
+print(this, "exact completeness:", "-" if completeness is None else f"{completeness*100}% ({completeness_stdev*100}%)")
+
+os.makedirs(f"{out_dir}/ratio_exact", exist_ok=True)
+with open(f"{out_dir}/ratio_exact/{this}.txt", "w") as writer:
+    writer.write(str(max_length))
+    for value in (consistency, consistency_stdev, completeness, completeness_stdev):
+        writer.write("\n")
+        writer.write(str(value))
\ No newline at end of file